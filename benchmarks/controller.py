@@ -0,0 +1,229 @@
+"""Offline benchmarks for the controller side of Lampsible.
+
+Everything that happens on the local machine before Ansible connects to
+any host: starting the CLI, constructing Lampsible, which writes the
+inventory and builds the RunnerConfig, computing Apache vars, writing
+extravars, validating CLI args with stubbed Ansible facts, and preparing
+the RunnerConfig. No remote server or network access is needed.
+
+Usage:
+
+    python benchmarks/controller.py [--repeat N] [--output results.json]
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import warnings
+from io import StringIO
+from time import perf_counter
+from statistics import mean, median
+from tempfile import TemporaryDirectory
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from lampsible import __version__
+from lampsible.constants import *
+from lampsible.cli import get_parser
+from lampsible.lampsible import Lampsible
+from lampsible.arg_validator import ArgValidator
+
+
+STUB_ANSIBLE_FACTS = {
+    'ubuntu_version': '24',
+    'ansible_distribution': 'Ubuntu',
+    'ansible_distribution_major_version': '24',
+}
+
+
+def summarize(timings):
+    return {
+        'runs':      len(timings),
+        'min_ms':    round(min(timings) * 1000, 3),
+        'median_ms': round(median(timings) * 1000, 3),
+        'mean_ms':   round(mean(timings) * 1000, 3),
+    }
+
+
+def bench_import(repeat):
+    """Wall time of a fresh interpreter importing lampsible.cli, minus
+    the wall time of a fresh interpreter doing nothing.
+    """
+    def time_command(code):
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True)
+            timings.append(perf_counter() - start)
+        return timings
+
+    baseline = time_command('pass')
+    cli = time_command('import lampsible.cli')
+    return {
+        'interpreter': summarize(baseline),
+        'import_lampsible_cli': summarize(cli),
+        'import_lampsible_cli_net_ms': round(
+            (median(cli) - median(baseline)) * 1000, 3),
+    }
+
+
+def bench_cli(repeat):
+    """Wall time of 'lampsible --version' and of 'lampsible' with an
+    invalid action, each in a fresh interpreter. Neither should have to
+    import Ansible, so both should come back in well under 100 ms.
+    """
+    commands = {
+        'version': ['--version'],
+        'argument_error': ['someuser@somehost.com', 'no-such-action'],
+    }
+    results = {}
+    for name, cli_args in commands.items():
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            subprocess.run(
+                [sys.executable, '-m', 'lampsible.cli'] + cli_args,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            timings.append(perf_counter() - start)
+        results[name] = summarize(timings)
+    return results
+
+
+def get_cli_argv(action, tmp_dir, app_build_path):
+    return [
+        'bench@bench.example.com',
+        action,
+        '--private-data-dir', os.path.join(tmp_dir, 'private-data'),
+        '--insecure-cli-password',
+        '--php-version', '8.3',
+        '--database-username', 'bench',
+        '--database-password', 'bench-password',
+        '--database-name', 'bench',
+        '--database-table-prefix', 'bench_',
+        '--site-title', 'Benchmark',
+        '--admin-username', 'bench-admin',
+        '--admin-email', 'admin@example.com',
+        '--admin-password', 'bench-admin-password',
+        '--joomla-admin-full-name', 'Bench Admin',
+        '--email-for-ssl', 'admin@example.com',
+        '--app-build-path', app_build_path,
+    ]
+
+
+def bench_validator(action, repeat, tmp_dir, app_build_path):
+    parser = get_parser()
+    timings = []
+    for _ in range(repeat):
+        args = parser.parse_args(
+            get_cli_argv(action, tmp_dir, app_build_path))
+        with redirect_stdout(StringIO()):
+            start = perf_counter()
+            tmp_args = ArgValidator.pre_validate_args(args)
+            validator = ArgValidator(tmp_args, dict(STUB_ANSIBLE_FACTS))
+            result = validator.validate_args()
+            timings.append(perf_counter() - start)
+        assert result == 0, 'ArgValidator failed for {}'.format(action)
+    return summarize(timings)
+
+
+def bench_lampsible(action, repeat, tmp_dir, app_build_path):
+    stages = {
+        '__init__':          [],
+        '_set_apache_vars':  [],
+        '_update_env':       [],
+        '_prepare_config':   [],
+    }
+    for i in range(repeat):
+        run_dir = os.path.join(tmp_dir, '{}-{}'.format(action, i))
+
+        start = perf_counter()
+        lampsible = Lampsible(
+            web_user='bench',
+            web_host='bench.example.com',
+            action=action,
+            private_data_dir=os.path.join(run_dir, 'private-data'),
+            fact_cache_dir=os.path.join(run_dir, 'facts'),
+            database_username='bench',
+            database_password='bench-password',
+            database_name='bench',
+            admin_password='bench-admin-password',
+            php_version='8.3',
+            php_extensions=[],
+            composer_packages=[],
+            domains_for_ssl=[],
+            extra_packages=['tmux'],
+            extra_env_vars={'FOO': 'bar'},
+            app_name='bench-app',
+            app_build_path=app_build_path,
+        )
+        stages['__init__'].append(perf_counter() - start)
+
+        for stage in ['_set_apache_vars', '_update_env', '_prepare_config']:
+            start = perf_counter()
+            getattr(lampsible, stage)()
+            stages[stage].append(perf_counter() - start)
+
+    return {
+        stage: summarize(timings) for stage, timings in stages.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Offline benchmarks for the controller side of Lampsible'
+    )
+    parser.add_argument('--repeat', type=int, default=20,
+        help='how often to run each benchmark, defaults to 20')
+    parser.add_argument('--output',
+        help='path of a JSON file to write the results to')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+
+    results = {
+        'lampsible_version': __version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'repeat': args.repeat,
+        'import': bench_import(args.repeat),
+        'cli': bench_cli(args.repeat),
+        'actions': {},
+    }
+
+    with TemporaryDirectory() as tmp_dir:
+        app_build_path = os.path.join(tmp_dir, 'bench-app.tar.gz')
+        with open(app_build_path, 'w') as f:
+            f.write('')
+
+        for action in SUPPORTED_ACTIONS:
+            results['actions'][action] = bench_lampsible(
+                action, args.repeat, tmp_dir, app_build_path)
+            results['actions'][action]['ArgValidator.validate_args'] = \
+                bench_validator(action, args.repeat, tmp_dir, app_build_path)
+
+    print('import lampsible.cli: {} ms (interpreter startup excluded)'.format(
+        results['import']['import_lampsible_cli_net_ms']))
+    for name, summary in results['cli'].items():
+        print('lampsible ({}): {} ms, {:.3f} ms without interpreter startup'.format(
+            name.replace('_', ' '),
+            summary['median_ms'],
+            summary['median_ms'] - results['import']['interpreter']['median_ms']
+        ))
+    for action, stages in results['actions'].items():
+        print('\n{}'.format(action))
+        for stage, summary in stages.items():
+            print('  {:<30} median {:>9.3f} ms   min {:>9.3f} ms'.format(
+                stage, summary['median_ms'], summary['min_ms']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('\nResults written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,15 @@ from re import match
 from copy import deepcopy
 from getpass import getpass
 from textwrap import dedent
-from requests import head as requests_head
 from lampsible.constants import *
 
 
 class ArgValidator():
 
-    def __init__(self, args, ansible_facts):
+    def __init__(self, args, ansible_facts=None):
         self.args           = args
         self.validated_args = deepcopy(args)
-        self.ansible_facts  = ansible_facts
+        self.ansible_facts  = ansible_facts or {}
 
 
     @staticmethod
@@ -23,20 +22,55 @@ class ArgValidator():
         except FileExistsError:
             pass
 
+        # If the hosts come from a file, the user will have omitted the
+        # first positional argument, so argparse put the action there.
+        if tmp_args.web_hosts_file and tmp_args.action is None:
+            tmp_args.action = tmp_args.web_user_host
+            tmp_args.web_user_host = None
+
         try:
-            tmp_inventory = tmp_args.web_user_host.split('@')
-            assert len(tmp_inventory) == 2
-            tmp_args.web_user = tmp_inventory[0]
-            tmp_args.web_host = tmp_inventory[1]
-        except (AttributeError, AssertionError):
+            tmp_args.web_hosts = ArgValidator.parse_web_hosts(
+                tmp_args.web_user_host,
+                tmp_args.web_hosts_file
+            )
+            tmp_args.web_user, tmp_args.web_host = \
+                tmp_args.web_hosts[0].split('@')
+        except (AttributeError, AssertionError, IndexError):
             print(dedent("""
-                FATAL! First positional argument must be in the format of user@host
+                FATAL! First positional argument must be in the format of user@host,
+                or a comma separated list of user@host.
                 """)
             )
             return 1
+        except FileNotFoundError:
+            print('FATAL! {} not found on local file system.'.format(
+                tmp_args.web_hosts_file
+            ))
+            return 1
         return tmp_args
 
 
+    @staticmethod
+    def parse_web_hosts(web_user_host, web_hosts_file=None):
+        """Returns a list of 'user@host' strings, either from a comma
+        separated list, or from a file with one 'user@host' per line.
+        Empty lines and lines starting with '#' in that file are ignored.
+        """
+        if web_hosts_file:
+            with open(web_hosts_file, 'r') as stream:
+                web_hosts = [
+                    line.strip() for line in stream
+                    if line.strip() and not line.strip().startswith('#')
+                ]
+        else:
+            web_hosts = [
+                user_host.strip() for user_host in web_user_host.split(',')
+            ]
+        for user_host in web_hosts:
+            assert len(user_host.split('@')) == 2
+        return web_hosts
+
+
     def get_validated_args(self):
         return self.validated_args
 
@@ -131,14 +165,23 @@ class ArgValidator():
 
 
     def validate_ansible_runner_args(self):
-        if self.args.web_user_host:
+        if self.args.web_user_host or self.args.web_hosts_file:
             try:
-                web_user_host = self.args.web_user_host.split('@')
+                self.validated_args.web_hosts = self.parse_web_hosts(
+                    self.args.web_user_host,
+                    self.args.web_hosts_file
+                )
+                web_user_host = self.validated_args.web_hosts[0].split('@')
                 self.validated_args.web_user = web_user_host[0]
                 self.validated_args.web_host = web_user_host[1]
-            except (IndexError, AttributeError):
+            except (IndexError, AttributeError, AssertionError):
                 print("FATAL! First positional argument must be in the format of 'user@host'.")
                 return 1
+            except FileNotFoundError:
+                print('FATAL! {} not found on local file system.'.format(
+                    self.args.web_hosts_file
+                ))
+                return 1
         elif not (self.args.web_user and self.args.web_host):
             print("FATAL! Got no 'web_user' and 'web_host'.")
             return 1
@@ -241,6 +284,7 @@ class ArgValidator():
                 and not self.args.action in [
                     'php',
                     'mysql',
+                    'plan',
                     'dump-ansible-facts'
                 ]:
             self.handle_defaults([
@@ -261,6 +305,11 @@ class ArgValidator():
                     self.args.email_for_ssl))
                 return 1
 
+            if self.args.ssl_renewal_window < 0:
+                print("\nFATAL! --ssl-renewal-window can't be negative. Got {}. Aborting.".format(
+                    self.args.ssl_renewal_window))
+                return 1
+
         return 0
 
 
@@ -271,24 +320,12 @@ class ArgValidator():
             # TODO: But if 'mysql' was passed with '--php-myadmin',
             # then we do need it. But PMA is not implemented currently.
             'mysql',
+            'plan',
             'dump-ansible-facts',
         ]:
             return 0
 
         if self.args.php_version:
-            if int(self.ansible_facts['ubuntu_version']) <= 20:
-                ubuntu_version = 'legacy'
-            else:
-                ubuntu_version = self.ansible_facts['ubuntu_version']
-
-            ubuntu_to_php_version = {
-                'legacy': '7.4',
-                '21'    : '8.0',
-                '22'    : '8.1',
-                '23'    : '8.2',
-                '24'    : '8.3',
-                'latest': '8.3',
-            }
             # Sanity check
             if self.validated_args.php_version not in SUPPORTED_PHP_VERSIONS:
                 print('FATAL! Invalid PHP version!')
@@ -312,7 +349,11 @@ class ArgValidator():
                 print('sudo apt install software-properties-common')
                 print('sudo add-apt-repository ppa:ondrej/php\n')
 
-            elif self.validated_args.php_version != ubuntu_to_php_version[ubuntu_version]:
+            # We only know the Ubuntu version if we have cached facts from
+            # a previous run. If not, the playbook checks this instead.
+            elif self.ansible_facts.get('ubuntu_version') \
+                    and self.validated_args.php_version \
+                    != self.get_ubuntu_php_version():
                 print(dedent("""
                     Warning! You are trying to install PHP {} on Ubuntu {}. Unless you manually configured the APT repository, this will not work.
                     """.format(
@@ -383,6 +424,26 @@ class ArgValidator():
         return 0
 
 
+    def get_ubuntu_php_version(self):
+        if int(self.ansible_facts['ubuntu_version']) <= 20:
+            ubuntu_version = 'legacy'
+        else:
+            ubuntu_version = self.ansible_facts['ubuntu_version']
+
+        ubuntu_to_php_version = {
+            'legacy': '7.4',
+            '21'    : '8.0',
+            '22'    : '8.1',
+            '23'    : '8.2',
+            '24'    : '8.3',
+            'latest': '8.3',
+        }
+        try:
+            return ubuntu_to_php_version[ubuntu_version]
+        except KeyError:
+            return ubuntu_to_php_version['latest']
+
+
     def validate_wordpress_args(self):
         if self.args.action != 'wordpress':
             return 0
@@ -428,6 +489,7 @@ class ArgValidator():
         if wp_version in RECENT_WORDPRESS_VERSIONS:
             return True
 
+        from requests import head as requests_head
         try:
             r = requests_head(
                 'https://wordpress.org/wordpress-{}.tar.gz'.format(wp_version)
@@ -589,6 +651,31 @@ class ArgValidator():
         except AttributeError:
             pass
 
+        try:
+            self.validated_args.force_roles = [
+                role.strip() for role in self.args.force_roles.split(',')
+            ]
+            available_roles = os.listdir(os.path.join(PROJECT_DIR, 'roles'))
+            for role in self.validated_args.force_roles:
+                assert role == 'all' or role in available_roles
+        except AttributeError:
+            self.validated_args.force_roles = []
+        except AssertionError:
+            print("FATAL! Invalid --force-role. Pass 'all', or one or more of: {}".format(
+                ', '.join(sorted(available_roles))
+            ))
+            return 1
+
+        # Each web server gets its own cache, only reachable from itself,
+        # so the servers of a fleet would serve each other's stale data.
+        if self.args.object_cache and len(self.validated_args.web_hosts) > 1:
+            print(dedent("""
+            FATAL! --object-cache only works with a single web server. Each
+            server would get its own {}, so whatever one of them changes
+            would stay stale in the cache of the others.
+            """.format(self.args.object_cache.capitalize())))
+            return 1
+
         return 0
 
 
@@ -616,6 +703,15 @@ class ArgValidator():
             Only use this for testing environments.
             """))
 
+        if self.args.http_performance and not self.args.php_fpm \
+                and self.args.action not in [
+                    'apache', 'mysql', 'plan', 'dump-ansible-facts']:
+            print(dedent("""
+            Warning! HTTP/2 requires a threaded Apache MPM, but mod_php only
+            works with the prefork MPM, so your site will only be served over
+            HTTP/1.1. Pass '--php-fpm' to get HTTP/2 as well.
+            """))
+
         if self.args.insecure_no_ssl:
             print(dedent("""
             WARNING! Your site will not have any encryption enabled!
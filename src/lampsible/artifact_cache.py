@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+from time import time
+from tempfile import NamedTemporaryFile
+
+
+class ArtifactCache:
+    """A content addressed cache for files that we download on the
+    controller and push to the hosts, like the WordPress tarball and
+    WP-CLI, so that each of them is downloaded once, rather than once
+    per host and per run.
+
+    Files are stored under their SHA-256 in 'blobs', and 'index.json'
+    maps keys like 'wordpress/6.7.1/en_US' to those files, with their
+    size, source and when they were last used. When the cache grows
+    beyond max_size bytes, the least recently used files are evicted.
+    In offline mode, nothing is downloaded, so everything has to be in
+    the cache already, for example, by copying over the cache directory
+    from another machine.
+    """
+
+    def __init__(self, cache_dir, max_size, offline=False):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.blobs_dir = os.path.join(self.cache_dir, 'blobs')
+        self.max_size  = max_size
+        self.offline   = offline
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+
+    def get_dir_path(self):
+        return self.cache_dir
+
+
+    def _get_index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+
+    def _load_index(self):
+        try:
+            with open(self._get_index_path(), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+    def _save_index(self, index):
+        tmp_path = '{}.tmp'.format(self._get_index_path())
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self._get_index_path())
+
+
+    @staticmethod
+    def get_file_hash(path, algorithm='sha256'):
+        file_hash = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+
+    def get(self, key):
+        """Returns the path of the cached file for key, or None.
+        Files that went missing or don't match their hash anymore
+        are treated as not cached.
+        """
+        index = self._load_index()
+        entry = index.get(key)
+        if not entry:
+            return None
+        path = os.path.join(self.blobs_dir, entry['sha256'])
+        try:
+            file_hash = self.get_file_hash(path)
+        except OSError:
+            file_hash = None
+        if file_hash != entry['sha256']:
+            del index[key]
+            self._save_index(index)
+            return None
+        entry['last_used'] = time()
+        self._save_index(index)
+        return path
+
+
+    def get_keys(self, prefix=''):
+        return [key for key in self._load_index() if key.startswith(prefix)]
+
+
+    def put(self, key, file_path, source=None):
+        """Moves file_path into the cache under key, and returns
+        the path of the cached file.
+        """
+        sha256 = self.get_file_hash(file_path)
+        path   = os.path.join(self.blobs_dir, sha256)
+        os.replace(file_path, path)
+        index = self._load_index()
+        index[key] = {
+            'sha256':    sha256,
+            'size':      os.path.getsize(path),
+            'source':    source,
+            'last_used': time(),
+        }
+        self._evict(index, keep=key)
+        self._save_index(index)
+        return path
+
+
+    def _evict(self, index, keep=None):
+        total_size = sum(entry['size'] for entry in index.values())
+        for key, entry in sorted(
+            index.items(),
+            key=lambda item: item[1]['last_used']
+        ):
+            if total_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            del index[key]
+            total_size -= entry['size']
+            # Several keys might point to the same file.
+            if not any(
+                other['sha256'] == entry['sha256'] for other in index.values()
+            ):
+                try:
+                    os.remove(os.path.join(self.blobs_dir, entry['sha256']))
+                except FileNotFoundError:
+                    pass
+
+
+    def fetch(self, key, url, checksum_url=None, checksum_algorithm='sha256'):
+        """Returns the path of the cached file for key, downloading it
+        from url first if necessary. If checksum_url is given, the download
+        is verified against the checksum published there.
+        Raises a RuntimeError if the file can't be had.
+        """
+        path = self.get(key)
+        if path:
+            return path
+        if self.offline:
+            raise RuntimeError(
+                "'{}' is not in the artifact cache at {}, and we're offline.".format(
+                    key,
+                    self.cache_dir
+                )
+            )
+
+        import requests
+        tmp_path = None
+        try:
+            if checksum_url:
+                r = requests.get(checksum_url, timeout=30)
+                r.raise_for_status()
+                expected_checksum = r.text.split()[0].lower()
+
+            file_hash = hashlib.new(checksum_algorithm)
+            with NamedTemporaryFile(dir=self.cache_dir, delete=False) as f:
+                tmp_path = f.name
+                with requests.get(url, stream=True, timeout=30) as r:
+                    r.raise_for_status()
+                    for chunk in r.iter_content(1024 * 1024):
+                        f.write(chunk)
+                        file_hash.update(chunk)
+        except (requests.RequestException, IndexError) as e:
+            if tmp_path:
+                os.remove(tmp_path)
+            raise RuntimeError("Failed to download '{}': {}".format(url, e))
+
+        if checksum_url and file_hash.hexdigest() != expected_checksum:
+            os.remove(tmp_path)
+            raise RuntimeError(
+                "Checksum mismatch for '{}', expected {} {}, got {}.".format(
+                    url,
+                    checksum_algorithm,
+                    expected_checksum,
+                    file_hash.hexdigest()
+                )
+            )
+        return self.put(key, tmp_path, url)
@@ -0,0 +1,105 @@
+import os
+import codecs
+import asyncio
+from ansible_runner.utils import OutputEventFilter
+
+
+class AsyncRun:
+    """A Lampsible run driven by asyncio, see Lampsible.run_async.
+
+    Await this object to get the result, which is the same as that of
+    Lampsible.run. Iterate over events() to get Ansible Runner's job events
+    while the playbook is running. Instead of blocking a thread on Ansible
+    Runner, this starts the prepared ansible-playbook command as an asyncio
+    subprocess, and feeds its output through Ansible Runner's own event
+    parsing, so the artifacts end up just as they would with Lampsible.run.
+    """
+
+    def __init__(self, lampsible, error=None):
+        self.lampsible = lampsible
+        self.runner    = lampsible.runner
+        self.config    = lampsible.runner_config
+        self.error     = error
+        self.process   = None
+        self.queue     = asyncio.Queue()
+        self.task      = asyncio.ensure_future(self._run())
+
+
+    def __await__(self):
+        return self.task.__await__()
+
+
+    async def events(self):
+        while True:
+            event = await self.queue.get()
+            if event is None:
+                return
+            yield event
+
+
+    def _event_callback(self, event_data):
+        # This writes the event into the artifacts dir, which we need
+        # for Runner.stats and Lampsible.get_host_results.
+        self.runner.event_callback(event_data)
+        if 'uuid' in event_data:
+            self.queue.put_nowait(event_data)
+
+
+    async def _run(self):
+        # Lampsible.run_async ran into this while preparing the run.
+        if self.error is not None:
+            self.queue.put_nowait(None)
+            return self.lampsible._get_error_result(self.error)
+        try:
+            return await self._execute()
+        except RuntimeError as e:
+            return self.lampsible._get_error_result(e)
+
+
+    async def _execute(self):
+        os.makedirs(
+            os.path.join(self.config.artifact_dir, 'job_events'),
+            mode=0o700,
+            exist_ok=True
+        )
+        try:
+            with open(
+                os.path.join(self.config.artifact_dir, 'stdout'), 'w'
+            ) as stdout:
+                event_filter = OutputEventFilter(
+                    stdout,
+                    self._event_callback,
+                    suppress_ansible_output=True
+                )
+                self.process = await asyncio.create_subprocess_exec(
+                    *self.config.command,
+                    cwd=self.config.cwd,
+                    env=self.config.env,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT
+                )
+                try:
+                    decoder = codecs.getincrementaldecoder('utf-8')(
+                        errors='replace')
+                    while True:
+                        chunk = await self.process.stdout.read(4096)
+                        if not chunk:
+                            break
+                        event_filter.write(decoder.decode(chunk))
+                    event_filter.close()
+                    self.runner.rc = await self.process.wait()
+                except asyncio.CancelledError:
+                    # Otherwise, ansible-playbook would carry on without us.
+                    if self.process.returncode is None:
+                        self.process.kill()
+                    await self.process.wait()
+                    raise
+        finally:
+            self.queue.put_nowait(None)
+
+        if self.runner.rc == 0:
+            self.runner.status = 'successful'
+        else:
+            self.runner.status = 'failed'
+        # Cleaning up the private data dir blocks, so not on the event loop.
+        return await asyncio.to_thread(self.lampsible._finish_run)
@@ -0,0 +1,169 @@
+"""Delta uploads of app builds, like Laravel apps.
+
+A manifest maps each member of the build archive to a hash of its
+content and mode. The manifest of the last deployed build is kept on
+the host, so on the next deploy, we only have to send the members that
+changed, and delete the ones that are gone. The Ansible role calls this
+module on the controller, see roles/laravel/tasks/main.yml:
+
+    python -m lampsible.build_sync --archive build.tar.gz \\
+        --manifest manifest.json --output delta.tar.gz < remote-manifest.json
+"""
+import os
+import sys
+import json
+import tarfile
+import posixpath
+import hashlib
+import argparse
+
+
+class BuildSync:
+
+    def __init__(self, archive_path):
+        self.archive_path = os.path.abspath(archive_path)
+
+
+    @staticmethod
+    def _normalize(name):
+        """Returns the name of a member the same way, no matter how the
+        archive was packed, for example 'app/x' for './app/x' or 'app/x/'.
+        The top level directory itself becomes an empty string.
+        """
+        name = posixpath.normpath(name.replace('\\', '/'))
+        while name.startswith('./'):
+            name = name[2:]
+        return '' if name == '.' else name.rstrip('/')
+
+
+    @staticmethod
+    def _is_safe(name):
+        return not (
+            os.path.isabs(name)
+            or '..' in name.split('/')
+        )
+
+
+    def get_manifest(self):
+        """Reads the archive as a stream, without extracting it, and
+        returns a dictionary mapping each member's name to a string
+        identifying its content and mode.
+        """
+        manifest = {}
+        with tarfile.open(self.archive_path, 'r|*') as archive:
+            for member in archive:
+                name = self._normalize(member.name)
+                if not name or not self._is_safe(name):
+                    continue
+                if member.isfile():
+                    member_hash = hashlib.sha256()
+                    f = archive.extractfile(member)
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        member_hash.update(chunk)
+                    content = member_hash.hexdigest()
+                elif member.isdir():
+                    content = 'dir'
+                elif member.issym():
+                    content = 'symlink:{}'.format(member.linkname)
+                elif member.islnk():
+                    # If the target changes, so does the hard link.
+                    content = 'hardlink:{}:{}'.format(
+                        member.linkname,
+                        manifest.get(self._normalize(member.linkname))
+                    )
+                else:
+                    continue
+                manifest[name] = '{}:{:o}'.format(content, member.mode)
+        return manifest
+
+
+    def write_manifest(self, manifest_path):
+        manifest = self.get_manifest()
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, sort_keys=True)
+        return manifest
+
+
+    def write_delta(self, manifest, remote_manifest, delta_path):
+        """Writes a gzipped tarball with only those members of the
+        archive that are new or changed compared to remote_manifest.
+        Returns the names of the changed members, and of those
+        that are in remote_manifest, but not in manifest anymore.
+        Deleted names never include anything in manifest, or any parent
+        directory of it, because the role deletes them after uploading.
+        """
+        manifest = {
+            self._normalize(name): content
+            for name, content in manifest.items()
+        }
+        remote_manifest = {
+            self._normalize(name): content
+            for name, content in remote_manifest.items()
+        }
+        kept = set(manifest)
+        for name in manifest:
+            parent = posixpath.dirname(name)
+            while parent:
+                kept.add(parent)
+                parent = posixpath.dirname(parent)
+        changed = [
+            name for name, content in manifest.items()
+            if remote_manifest.get(name) != content
+        ]
+        deleted = sorted(
+            name for name in remote_manifest
+            if name and name not in kept and self._is_safe(name)
+        )
+        changed_set = set(changed)
+        # A hard link can only be extracted along with its target.
+        for name in changed:
+            if manifest[name].startswith('hardlink:'):
+                changed_set.add(
+                    self._normalize(manifest[name].split(':')[1]))
+        with tarfile.open(self.archive_path, 'r|*') as archive, \
+                tarfile.open(delta_path, 'w:gz', compresslevel=6) as delta:
+            for member in archive:
+                if self._normalize(member.name) not in changed_set:
+                    continue
+                if member.isfile():
+                    delta.addfile(member, archive.extractfile(member))
+                else:
+                    delta.addfile(member)
+        return changed, deleted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m lampsible.build_sync',
+        description="""
+        Writes a delta archive of an app build, compared to the manifest of
+        the build on the host, which is read from stdin.
+        """
+    )
+    parser.add_argument('--archive', required=True)
+    parser.add_argument('--manifest', required=True)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, 'r') as f:
+        manifest = json.load(f)
+    try:
+        remote_manifest = json.loads(sys.stdin.read() or '{}')
+    except ValueError:
+        remote_manifest = {}
+
+    changed, deleted = BuildSync(args.archive).write_delta(
+        manifest,
+        remote_manifest,
+        args.output
+    )
+    print(json.dumps({
+        'changed': len(changed),
+        'deleted': deleted,
+        'delta':   os.path.abspath(args.output),
+    }))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
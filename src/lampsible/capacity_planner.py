@@ -0,0 +1,274 @@
+"""Sizes Apache, PHP and MySQL from a host's memory and CPUs.
+
+Everything comes out of one budget: Some memory is reserved for the
+system, and if the web server and the database share the host, they
+share the rest. The PHP workers are sized to fit into the web server's
+share, after OPcache, and Apache and MySQL are sized to match the PHP
+workers. The playbooks use it through the 'capacity_plan' filter, see
+project/filter_plugins/lampsible_filters.py. For a quick look:
+
+    python -m lampsible.capacity_planner --memory-mb 2048 --vcpus 2 \\
+        --web --database --php
+"""
+import sys
+import json
+import argparse
+from .constants import *
+
+
+class CapacityPlanner:
+
+    def __init__(self, memory_mb, vcpus, web=True, database=True, php=True,
+            php_fpm=False, php_fpm_pools=1, object_cache=False,
+            php_process_memory=DEFAULT_PHP_PROCESS_MEMORY):
+        self.memory_mb          = int(memory_mb)
+        self.vcpus              = max(1, int(vcpus))
+        self.web                = web
+        self.database           = database
+        self.php                = php
+        self.php_fpm            = php_fpm
+        self.php_fpm_pools      = max(1, int(php_fpm_pools))
+        self.object_cache       = object_cache
+        self.php_process_memory = php_process_memory
+
+
+    @classmethod
+    def from_facts(cls, facts, **kwargs):
+        """Takes facts as cached by FactCache, which are prefixed
+        with 'ansible_'. Raises a KeyError if the memory is missing.
+        """
+        return cls(
+            facts['ansible_memtotal_mb'],
+            facts.get('ansible_processor_vcpus', 1),
+            **kwargs
+        )
+
+
+    @staticmethod
+    def _round_down(value, step):
+        return value // step * step
+
+
+    @staticmethod
+    def _clamp(value, minimum, maximum):
+        return max(minimum, min(value, maximum))
+
+
+    def get_plan(self):
+        """Returns a flat dictionary, so that templates can easily use it.
+        All memory sizes are in megabytes.
+        """
+        reserved_memory  = self._clamp(self.memory_mb // 10, 256, 1024)
+        available_memory = max(self.memory_mb - reserved_memory, 256)
+        if self.web and self.database:
+            database_memory = available_memory * 2 // 5
+        elif self.database:
+            database_memory = available_memory
+        else:
+            database_memory = 0
+
+        plan = {
+            'memory_mb':       self.memory_mb,
+            'vcpus':           self.vcpus,
+            'reserved_memory': reserved_memory,
+            'web_memory':      available_memory - database_memory,
+            'database_memory': database_memory,
+        }
+        if self.web and self.object_cache:
+            # Redis or Memcached, on the web server, next to PHP.
+            plan['object_cache_memory'] = self._clamp(
+                self._round_down(plan['web_memory'] // 16, 16), 32, 1024)
+        if self.web:
+            plan.update(self._plan_web(
+                plan['web_memory'] - plan.get('object_cache_memory', 0)))
+        if self.database:
+            plan.update(self._plan_database(
+                database_memory,
+                plan.get('php_workers', 0)
+            ))
+        return plan
+
+
+    def _plan_web(self, web_memory):
+        if not self.php:
+            # Apache's event MPM on its own, with a few MB per thread.
+            max_request_workers = self._clamp(
+                self._round_down(web_memory // 4, 25), 150, 1600)
+            return {
+                'apache_mpm':                 'event',
+                'apache_max_request_workers': max_request_workers,
+                'apache_threads_per_child':   25,
+                'apache_server_limit':        max_request_workers // 25,
+                'php_workers':                0,
+            }
+
+        opcache_memory = self._clamp(
+            self._round_down(web_memory // 10, 16), 64, 512)
+        # Only PHP 8 has a JIT compiler, but we don't know which version
+        # the host ends up with, so we always keep memory for it.
+        jit_buffer_size = self._clamp(
+            self._round_down(opcache_memory // 4, 8), 16, 128)
+        php_memory = web_memory - opcache_memory - jit_buffer_size
+        if self.php_fpm:
+            # Apache's threads are cheap, compared to PHP processes.
+            php_memory -= 64
+        # Beyond this, more workers only compete for the CPUs.
+        php_workers = self._clamp(
+            php_memory // self.php_process_memory, 2, self.vcpus * 16)
+
+        # The PHP workers' average has to fit into the budget, but a
+        # single request can take a lot more than that.
+        memory_limit = 128
+        while memory_limit * 2 <= min(php_memory // 4, 512):
+            memory_limit *= 2
+
+        plan = {
+            'opcache_memory':                  opcache_memory,
+            'opcache_interned_strings_buffer': self._clamp(
+                opcache_memory // 8, 8, 64),
+            # Frameworks with their dependencies easily have more than
+            # the default of 10000 files.
+            'opcache_max_accelerated_files':   self._clamp(
+                opcache_memory * 125, 10000, 100000),
+            'opcache_jit_buffer_size':         jit_buffer_size,
+            'php_workers':                     php_workers,
+            'php_memory_limit':                memory_limit,
+        }
+
+        if self.php_fpm:
+            # Apache only waits for PHP-FPM, and handles keep-alive
+            # connections and static files alongside.
+            max_request_workers = max(
+                150,
+                -(-php_workers * 4 // 25) * 25
+            )
+            pool_workers  = max(2, php_workers // self.php_fpm_pools)
+            start_servers = min(pool_workers, max(2, self.vcpus * 2))
+            plan.update({
+                'apache_mpm':                 'event',
+                'apache_max_request_workers': max_request_workers,
+                'apache_threads_per_child':   25,
+                'apache_server_limit':        max_request_workers // 25,
+                'php_fpm_pools':              self.php_fpm_pools,
+                'php_fpm_max_children':       pool_workers,
+                'php_fpm_start_servers':      start_servers,
+                'php_fpm_min_spare_servers':  max(1, start_servers // 2),
+                'php_fpm_max_spare_servers':  min(pool_workers, start_servers * 2),
+            })
+        else:
+            # With mod_php, every Apache worker is a PHP worker.
+            plan.update({
+                'apache_mpm':                 'prefork',
+                'apache_max_request_workers': php_workers,
+                'apache_server_limit':        php_workers,
+            })
+        return plan
+
+
+    def _plan_database(self, database_memory, php_workers):
+        innodb_buffer_pool_size = max(
+            128,
+            self._round_down(database_memory * 7 // 10, 128)
+        )
+        if self.web:
+            # Each PHP worker holds at most one connection, and we
+            # leave some for cron jobs, WP-CLI, Drush and Artisan.
+            max_connections = php_workers + 20
+        else:
+            # We don't know how many web servers will connect, so
+            # we go by memory, at about 4 MB per connection.
+            max_connections = self._clamp(
+                (database_memory - innodb_buffer_pool_size) // 4, 100, 1000)
+        return {
+            'mysql_innodb_buffer_pool_size': innodb_buffer_pool_size,
+            'mysql_max_connections':         max_connections,
+        }
+
+
+    def format_plan(self, plan=None):
+        if plan is None:
+            plan = self.get_plan()
+        lines = [
+            'Memory: {} MB, of which {} MB are reserved for the system, vCPUs: {}'.format(
+                plan['memory_mb'],
+                plan['reserved_memory'],
+                plan['vcpus']
+            ),
+        ]
+        if self.web:
+            apache_line = 'Apache ({} MPM): MaxRequestWorkers {}, ServerLimit {}'.format(
+                plan['apache_mpm'],
+                plan['apache_max_request_workers'],
+                plan['apache_server_limit']
+            )
+            if 'apache_threads_per_child' in plan:
+                apache_line += ', ThreadsPerChild {}'.format(
+                    plan['apache_threads_per_child'])
+            lines.append(apache_line)
+        if self.web and self.php:
+            if self.php_fpm:
+                lines.append(
+                    'PHP-FPM: {} pool(s), pm.max_children {}, pm.start_servers {}, pm.min_spare_servers {}, pm.max_spare_servers {}'.format(
+                        plan['php_fpm_pools'],
+                        plan['php_fpm_max_children'],
+                        plan['php_fpm_start_servers'],
+                        plan['php_fpm_min_spare_servers'],
+                        plan['php_fpm_max_spare_servers']
+                    )
+                )
+            lines.append('PHP: {} workers, memory_limit {}M'.format(
+                plan['php_workers'],
+                plan['php_memory_limit']
+            ))
+            lines.append(
+                'OPcache: {} MB, interned strings {} MB, max_accelerated_files {}, JIT buffer {} MB (PHP 8 only)'.format(
+                    plan['opcache_memory'],
+                    plan['opcache_interned_strings_buffer'],
+                    plan['opcache_max_accelerated_files'],
+                    plan['opcache_jit_buffer_size']
+                )
+            )
+        if 'object_cache_memory' in plan:
+            lines.append('Object cache: {} MB'.format(
+                plan['object_cache_memory']))
+        if self.database:
+            lines.append('MySQL: innodb_buffer_pool_size {}M, max_connections {}'.format(
+                plan['mysql_innodb_buffer_pool_size'],
+                plan['mysql_max_connections']
+            ))
+        return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m lampsible.capacity_planner',
+        description="""
+        Prints the capacity plan for a host as JSON.
+        """
+    )
+    parser.add_argument('--memory-mb', type=int, required=True)
+    parser.add_argument('--vcpus', type=int, default=1)
+    parser.add_argument('--web', action='store_true')
+    parser.add_argument('--database', action='store_true')
+    parser.add_argument('--php', action='store_true')
+    parser.add_argument('--php-fpm', action='store_true')
+    parser.add_argument('--php-fpm-pools', type=int, default=1)
+    parser.add_argument('--object-cache', action='store_true')
+    args = parser.parse_args(argv)
+
+    planner = CapacityPlanner(
+        args.memory_mb,
+        args.vcpus,
+        web=args.web,
+        database=args.database,
+        php=args.php,
+        php_fpm=args.php_fpm,
+        php_fpm_pools=args.php_fpm_pools,
+        object_cache=args.object_cache
+    )
+    print(json.dumps(planner.get_plan(), sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Decides whether Certbot has to run, from what openssl says about the
+existing certificate, that is, the output of 'openssl x509 -text', which
+is empty if there is no certificate yet. The ssl-certbot role uses it
+through the 'certbot_decision' filter, see
+project/filter_plugins/lampsible_filters.py. For a quick look:
+
+    python -m lampsible.certificate_check --domains example.com,www.example.com \\
+        --key-type ecdsa --expiring
+"""
+import re
+import sys
+import json
+import argparse
+from .constants import *
+
+
+class CertificateCheck:
+
+    def __init__(self, text, domains, key_type=DEFAULT_SSL_KEY_TYPE,
+            expiring=False):
+        self.text     = text
+        self.domains  = domains
+        self.key_type = key_type
+        self.expiring = expiring
+
+
+    def get_domains(self):
+        return sorted(set(re.findall(r'DNS:([^,\s]+)', self.text)))
+
+
+    def get_key_type(self):
+        if 'id-ecPublicKey' in self.text:
+            return 'ecdsa'
+        if 'rsaEncryption' in self.text:
+            return 'rsa'
+        return None
+
+
+    def has_same_domains(self):
+        return self.get_domains() == sorted(
+            set(domain.lower() for domain in self.domains))
+
+
+    def is_valid(self):
+        """Returns True if the certificate doesn't expire within the
+        renewal window, and has the type of key that we want.
+        """
+        return not self.expiring and self.get_key_type() == self.key_type
+
+
+    def get_decision(self):
+        """If only the domains changed, Certbot updates the certificate
+        in place. Otherwise, it has to be forced to renew it, because its
+        own renewal window might be shorter than ours.
+        """
+        same_domains = self.has_same_domains()
+        run_certbot  = not (self.is_valid() and same_domains)
+        return {
+            'run_certbot'  : run_certbot,
+            'force_renewal': run_certbot and same_domains,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m lampsible.certificate_check',
+        description="""
+        Reads the output of 'openssl x509 -text' from stdin, and prints
+        as JSON whether Certbot has to run, and whether it has to force
+        the renewal.
+        """
+    )
+    parser.add_argument('--domains', required=True)
+    parser.add_argument('--key-type', choices=SUPPORTED_SSL_KEY_TYPES,
+        default=DEFAULT_SSL_KEY_TYPE)
+    parser.add_argument('--expiring', action='store_true')
+    args = parser.parse_args(argv)
+
+    check = CertificateCheck(
+        sys.stdin.read(),
+        args.domains.split(','),
+        key_type=args.key_type,
+        expiring=args.expiring
+    )
+    print(json.dumps(check.get_decision(), sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,9 @@
 import argparse
-from textwrap import dedent
-from ansible_runner import Runner, RunnerConfig, run_command
 from . import __version__
 from .constants import *
-from .lampsible import Lampsible
-from .arg_validator import ArgValidator
 
 
-def main():
+def get_parser():
 
     parser = argparse.ArgumentParser(
         prog='lampsible',
@@ -21,7 +17,11 @@ def main():
     # ----------------------
 
     parser.add_argument('web_user_host', nargs='?',
-        help="example: someuser@somehost.com"
+        help="""
+        example: someuser@somehost.com - You can also pass a comma separated
+        list, like someuser@host1.com,otheruser@host2.com, to provision
+        all of these hosts in parallel in one run.
+        """
     )
     parser.add_argument('action', choices=SUPPORTED_ACTIONS, nargs='?')
 
@@ -93,6 +93,22 @@ def main():
         based on your remote server
         """.format(DEFAULT_PHP_VERSION)
     )
+    parser.add_argument('--php-fpm', action='store_true',
+        help="""
+        Pass this flag to run PHP with PHP-FPM, and Apache with the event MPM,
+        instead of mod_php and the prefork MPM. Each virtual host gets its own
+        PHP-FPM pool, sized to your server's memory and CPUs. This lets your
+        server handle a lot more concurrent requests.
+        """
+    )
+    parser.add_argument('--object-cache', choices=SUPPORTED_OBJECT_CACHES,
+        help="""
+        Install Redis or Memcached on your web server, sized to its memory,
+        along with the PHP extension, and let WordPress, Drupal, Joomla or
+        your Laravel app keep their caches in it, instead of querying the
+        database for the same things over and over again.
+        """
+    )
     # TODO
     # parser.add_argument('--php-my-admin', action='store_true')
 
@@ -134,6 +150,11 @@ def main():
             DEFAULT_WORDPRESS_LOCALE
         )
     )
+    parser.add_argument('--wp-cli-version', default=DEFAULT_WP_CLI_VERSION,
+        help="the version of WP-CLI to be installed, defaults to '{}'".format(
+            DEFAULT_WP_CLI_VERSION
+        )
+    )
 
     # Joomla
     # ------
@@ -173,6 +194,13 @@ def main():
         for example /path/to/some-app-2.0.tar.gz
         """
     )
+    parser.add_argument('--no-app-build-sync', action='store_true',
+        help="""
+        Pass this flag to always upload the whole build-archive of your app.
+        By default, Lampsible only uploads the files that changed since your
+        last deploy, and uploads the whole archive only on the first deploy.
+        """
+    )
 
     # SSL
     # ---
@@ -206,6 +234,37 @@ def main():
         based on your host and action.
         """
     )
+    parser.add_argument('--ssl-renewal-window', type=int,
+        default=DEFAULT_SSL_RENEWAL_WINDOW,
+        help="""
+        Lampsible only runs Certbot if there is no certificate for your
+        domains yet, or if it expires within this many days.
+        Defaults to {}.
+        """.format(DEFAULT_SSL_RENEWAL_WINDOW)
+    )
+    parser.add_argument('--acme-server',
+        help="""
+        the directory URL of the ACME server that Certbot should use, instead
+        of Let's Encrypt. This is useful for testing against a local ACME
+        server like Pebble. Overrides '--ssl-test-cert'.
+        """
+    )
+    parser.add_argument('--acme-ca-bundle',
+        help="""
+        the path of a CA bundle on your web server, which Certbot should
+        trust when it talks to the ACME server given with '--acme-server',
+        for example, Pebble's CA, or the one of your own staging server.
+        """
+    )
+    parser.add_argument('--ssl-key-type', choices=SUPPORTED_SSL_KEY_TYPES,
+        default=DEFAULT_SSL_KEY_TYPE,
+        help="""
+        the type of your certificate's private key, for Certbot as well as
+        for self signed certificates. Defaults to '{}', that is, P-256 keys,
+        which make TLS handshakes a lot cheaper than 2048 bit RSA keys.
+        Only use 'rsa' if you have to support very old clients.
+        """.format(DEFAULT_SSL_KEY_TYPE)
+    )
     parser.add_argument('--insecure-no-ssl', action='store_true',
         help="""
         Pass this flag to set up your website without any SSL encryption.
@@ -230,6 +289,104 @@ def main():
         """
     )
     parser.add_argument('--ssh-key-file', '-i',  help='path to your private SSH key')
+    parser.add_argument('--no-fast-transport', action='store_true',
+        help="""
+        By default, Lampsible configures Ansible to keep SSH connections
+        open between tasks (ControlPersist), and to use pipelining,
+        which makes deployments a lot faster. Pass this flag to leave
+        these to your own Ansible configuration, for example if your remote
+        server's sudoers configuration sets 'requiretty'.
+        """
+    )
+    parser.add_argument('--profile', action='store_true',
+        help="""
+        Pass this flag to print the slowest roles and tasks when the
+        deployment is done, and to write the wall time of each task
+        into a JSON file and a folded stacks file, which you can turn
+        into a flame graph.
+        """
+    )
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR,
+        help="""
+        the directory into which '--profile' writes its files, in a
+        subdirectory for each run. Defaults to '{}'.
+        """.format(DEFAULT_PROFILE_DIR)
+    )
+    parser.add_argument('--artifact-cache-dir',
+        default=DEFAULT_ARTIFACT_CACHE_DIR,
+        help="""
+        the directory where Lampsible caches files that it downloads once,
+        and pushes to your hosts, like WordPress and WP-CLI.
+        Defaults to '{}'.
+        """.format(DEFAULT_ARTIFACT_CACHE_DIR)
+    )
+    parser.add_argument('--artifact-cache-max-size', type=int,
+        default=DEFAULT_ARTIFACT_CACHE_MAX_SIZE,
+        help="""
+        the size in megabytes up to which the artifact cache may grow,
+        before the least recently used files are evicted. Defaults to {}.
+        """.format(DEFAULT_ARTIFACT_CACHE_MAX_SIZE)
+    )
+    parser.add_argument('--offline', action='store_true',
+        help="""
+        Pass this flag to use only what's in the artifact cache, without
+        downloading anything on the controller. Fails if something is missing.
+        """
+    )
+    parser.add_argument('--fact-cache-dir',
+        default=DEFAULT_FACT_CACHE_DIR,
+        help="""
+        the directory in which Lampsible caches Ansible facts of your hosts
+        between runs. Defaults to '{}'.
+        """.format(DEFAULT_FACT_CACHE_DIR)
+    )
+    parser.add_argument('--fact-cache-ttl', type=int,
+        default=DEFAULT_FACT_CACHE_TTL,
+        help="""
+        how many seconds cached Ansible facts remain valid. Defaults to {}.
+        Pass 0 to never expire them.
+        """.format(DEFAULT_FACT_CACHE_TTL)
+    )
+    parser.add_argument('--invalidate-fact-cache', action='store_true',
+        help="""
+        Pass this flag to discard all cached Ansible facts,
+        and gather them fresh from your hosts.
+        """
+    )
+    parser.add_argument('--force-role', dest='force_roles',
+        help="""
+        By default, Lampsible skips roles whose inputs haven't changed since
+        the last successful run on a host. Pass a comma separated list of
+        roles, for example 'apache2,php', to run them anyway, or 'all'.
+        """
+    )
+    parser.add_argument('--no-converge', action='store_true',
+        help="""
+        Pass this flag to always run all roles, and not record
+        which roles ran on your hosts.
+        """
+    )
+    parser.add_argument('--galaxy-offline-dir',
+        help="""
+        path to a directory with Ansible Galaxy collection tarballs, as
+        downloaded by 'ansible-galaxy collection download'. If any required
+        collections are missing, Lampsible installs them from there,
+        instead of downloading them from Galaxy.
+        """
+    )
+    parser.add_argument('--web-hosts-file',
+        help="""
+        path to a file with one user@host per line. Pass this instead of
+        the first positional argument to provision all of these hosts
+        in parallel in one run.
+        """
+    )
+    parser.add_argument('--forks', type=int, default=DEFAULT_FORKS,
+        help="""
+        how many hosts Ansible should work on in parallel,
+        if you are provisioning several hosts. Defaults to {}.
+        """.format(DEFAULT_FORKS)
+    )
     parser.add_argument('--private-data-dir',
         default=DEFAULT_PRIVATE_DATA_DIR,
         help="""
@@ -258,6 +415,15 @@ def main():
         blank to let Lampsible pick a good default.
         """
     )
+    parser.add_argument('--http-performance', action='store_true',
+        help="""
+        Pass this flag to tune how Apache delivers your site: HTTP/2,
+        compression with Brotli or gzip, including precompressed files like
+        app.css.br, long-lived cache headers for versioned static files,
+        and sendfile. HTTP/2 requires '--php-fpm', unless you don't
+        install PHP at all.
+        """
+    )
 
     # Database
     # --------
@@ -305,6 +471,15 @@ def main():
         Pass this flag to create the specified Composer project.
         """
     )
+    parser.add_argument('--composer-cache-dir',
+        help="""
+        a directory on your local machine in which to keep a Composer cache.
+        Lampsible seeds the Composer cache on your hosts with it, and brings
+        new downloads back into it, so repeated installs, including on
+        new hosts, don't download the same packages again. You can also
+        fill it in advance, for example with the cache of another machine.
+        """
+    )
 
     # All CMS
     # -------
@@ -389,57 +564,46 @@ def main():
         version=__version__
     )
 
-    args = parser.parse_args()
+    return parser
 
-    print(LAMPSIBLE_BANNER)
 
-    # Fetching Ansible Facts
-    # TODO: The only reason that we do this, is so we can check the
-    # PHP version against the remote Ubuntu version. So we should
-    # move this ArgValidator.validate_php_args, and only call it if
-    # the user passed in a php_version.
+def main(argv=None):
+
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    # These pull in Ansible, which takes a while to import, so we only
+    # import them once we know that we'll actually need them, and not
+    # for --help, --version or invalid arguments.
+    from ansible_runner import run_command
+    from .lampsible import Lampsible
+    from .arg_validator import ArgValidator
+    from .fact_cache import FactCache
+    from .helpers import ensure_ansible_galaxy_dependencies
+
+    print(LAMPSIBLE_BANNER)
 
     tmp_args = ArgValidator.pre_validate_args(args)
     if tmp_args == 1:
         print('FATAL! Got invalid user input, and cannot continue. Please fix the issues listed above and try again.')
         return 1
 
-    tmp_rc = RunnerConfig(
-        private_data_dir=tmp_args.private_data_dir,
-        project_dir=PROJECT_DIR,
-        inventory='{}@{},'.format(tmp_args.web_user, tmp_args.web_host),
-        playbook='get-ansible-facts.yml',
-    )
-
-    if args.ssh_key_file:
-        try:
-            with open(os.path.abspath(args.ssh_key_file), 'r') as key_file:
-                key_data = key_file.read()
-            tmp_rc.ssh_key_data = key_data
-        except FileNotFoundError:
-            print('Warning! SSH key file not found!')
-
-    tmp_rc.prepare()
-    tmp_r = Runner(config=tmp_rc)
-    tmp_r.run()
-
-    if tmp_r.status == 'successful':
-        ansible_facts = tmp_r.get_fact_cache(
-            '{}@{}'.format(
-                tmp_args.web_user,
-                tmp_args.web_host
-            ))
-    else:
-        print(dedent("""
-                    FATAL! Failed to fetch Ansible facts.
-                    This is most likely because Ansible cannot establish
-                    an SSH connection to your host. Please double check
-                    SSH credentials and try again.
-                     """
-        ))
-        return 1
+    fact_cache = FactCache(args.fact_cache_dir, args.fact_cache_ttl)
+    if args.invalidate_fact_cache:
+        fact_cache.invalidate()
+
+    # We don't fetch Ansible facts up front. If we have them cached from
+    # a previous run, ArgValidator can use them to warn about some things
+    # early on. Otherwise, the first play of the playbook gathers them,
+    # and fails early if the requested PHP version can't be installed.
+    ansible_facts = fact_cache.get_facts(tmp_args.web_host)
+    if 'ansible_distribution_major_version' in ansible_facts:
+        ansible_facts.setdefault(
+            'ubuntu_version',
+            ansible_facts['ansible_distribution_major_version']
+        )
 
-    validator = ArgValidator(args, ansible_facts)
+    validator = ArgValidator(tmp_args, ansible_facts)
     result = validator.validate_args()
 
     if result != 0:
@@ -451,11 +615,14 @@ def main():
     lampsible = Lampsible(
         web_user=args.web_user,
         web_host=args.web_host,
+        web_hosts=args.web_hosts,
+        forks=args.forks,
         action=args.action,
         private_data_dir=args.private_data_dir,
         apache_server_admin=args.apache_server_admin,
         apache_document_root=args.apache_document_root,
         apache_vhost_name=args.apache_vhost_name,
+        http_performance=args.http_performance,
         # TODO: Improve this. The Lampsible library should handle this,
         # otherwise users will experience annoying errors.
         ssl_certbot=(not (
@@ -463,12 +630,17 @@ def main():
             or args.ssl_selfsigned
             or args.action in [
                 'dump-ansible-facts',
+                'plan',
                 'php',
                 'mysql',
             ]
             )),
         ssl_selfsigned=args.ssl_selfsigned,
         ssl_test_cert=args.ssl_test_cert,
+        ssl_renewal_window=args.ssl_renewal_window,
+        acme_server=args.acme_server,
+        acme_ca_bundle=args.acme_ca_bundle,
+        ssl_key_type=args.ssl_key_type,
         email_for_ssl=args.email_for_ssl,
         database_username=args.database_username,
         database_password=args.database_password,
@@ -479,9 +651,14 @@ def main():
         database_system_host=args.database_system_host,
         php_version=args.php_version,
         php_extensions=args.php_extensions,
+        php_fpm=args.php_fpm,
+        object_cache=args.object_cache,
         composer_packages=args.composer_packages,
         composer_working_directory=args.composer_working_directory,
         composer_project=args.composer_project,
+        composer_cache_dir=args.composer_cache_dir,
+        converge=not args.no_converge,
+        force_roles=args.force_roles,
         site_title=args.site_title,
         admin_username=args.admin_username,
         admin_password=args.admin_password,
@@ -494,12 +671,22 @@ def main():
         drupal_profile=args.drupal_profile,
         app_name=args.app_name,
         app_build_path=args.app_build_path,
+        app_build_sync=not args.no_app_build_sync,
         laravel_artisan_commands=args.laravel_artisan_commands,
         app_local_env=args.app_local_env,
         extra_env_vars=args.extra_env_vars,
         extra_packages=args.extra_packages,
         ssh_key_file=args.ssh_key_file,
-        remote_sudo_password=args.remote_sudo_password
+        remote_sudo_password=args.remote_sudo_password,
+        fact_cache_dir=args.fact_cache_dir,
+        fact_cache_ttl=args.fact_cache_ttl,
+        fast_transport=not args.no_fast_transport,
+        profile=args.profile,
+        profile_dir=args.profile_dir,
+        artifact_cache_dir=args.artifact_cache_dir,
+        artifact_cache_max_size=args.artifact_cache_max_size,
+        offline=args.offline,
+        wp_cli_version=args.wp_cli_version,
     )
 
     # TODO: Improve this?
@@ -508,7 +695,8 @@ def main():
             PROJECT_DIR,
             'ansible-galaxy-requirements.yml'
         ),
-        USER_HOME_DIR
+        USER_HOME_DIR,
+        offline_dir=args.galaxy_offline_dir
     )
     if galaxy_result == 1:
         return 1
@@ -520,10 +708,7 @@ def main():
             executable_cmd='ansible',
             cmdline_args=[
                 '-i',
-                '{}@{},'.format(
-                    args.web_user,
-                    args.web_host,
-                ),
+                '{},'.format(','.join(args.web_hosts)),
                 'ungrouped',
                 '-m',
                 'setup'
@@ -532,8 +717,23 @@ def main():
         lampsible.private_data_helper.cleanup_dir()
         return 0
 
+    elif args.action == 'plan':
+        planners = lampsible.get_capacity_planners()
+        for host, planner in planners.items():
+            print('\n{}\n{}'.format(host, planner.format_plan()))
+        lampsible.private_data_helper.cleanup_dir()
+        return int(not planners)
+
     else:
-        lampsible.run()
+        result = lampsible.run()
+
+    if lampsible.is_fleet():
+        for web_host, host_result in result.items():
+            print('{}: {}'.format(
+                web_host,
+                'OK' if host_result == 0 else 'FAILED'
+            ))
+        return int(any(result.values()))
 
     return 0
 
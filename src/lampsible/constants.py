@@ -1,6 +1,6 @@
 import os
+from importlib.resources import files
 from . import __version__
-from .helpers import *
 
 # Lampsible
 # ---------
@@ -31,6 +31,8 @@ SUPPORTED_ACTIONS = [
     'drupal',
     # PHP frameworks
     'laravel',
+    # Capacity planning
+    'plan',
     # Local debugging
     'dump-ansible-facts',
 ]
@@ -38,11 +40,54 @@ SUPPORTED_ACTIONS = [
 # Script paths
 # ------------
 USER_HOME_DIR            = os.path.expanduser('~')
-PROJECT_DIR              = find_package_project_dir()
+# Resolved from the location of the installed package, rather than
+# by searching sys.path, which would slow down every CLI invocation.
+PROJECT_DIR              = str(files(__package__).joinpath('project'))
 DEFAULT_PRIVATE_DATA_DIR = os.path.join(USER_HOME_DIR, '.lampsible')
 # If the user does not supply a value, this will be overwritten by a path
 # inside the package installation, which we detect later on.
 
+# Unlike the private data dir, this one survives between runs.
+DEFAULT_CACHE_DIR        = os.path.join(USER_HOME_DIR, '.cache', 'lampsible')
+
+# Ansible Runner
+# --------------
+# How many hosts Ansible works on in parallel, relevant in fleet mode.
+DEFAULT_FORKS = 10
+# Passed to Ansible, unless the user opts out, or set these already.
+# See Lampsible._get_transport_envvars.
+DEFAULT_SSH_CONTROL_PERSIST = 300
+DEFAULT_ANSIBLE_TIMEOUT     = 30
+
+# Ansible facts
+# -------------
+DEFAULT_FACT_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'facts')
+# In seconds. 0 means that cached facts never expire.
+DEFAULT_FACT_CACHE_TTL = 86400
+
+# Ansible Galaxy
+# --------------
+# Remembers that the collections in ansible-galaxy-requirements.yml
+# are installed, so we don't have to check on every run.
+DEFAULT_GALAXY_STAMP_FILE = os.path.join(DEFAULT_CACHE_DIR, 'galaxy.stamp')
+
+# Artifact cache
+# --------------
+# Files that we download once on the controller, and push to the hosts.
+DEFAULT_ARTIFACT_CACHE_DIR      = os.path.join(DEFAULT_CACHE_DIR, 'artifacts')
+# In megabytes.
+DEFAULT_ARTIFACT_CACHE_MAX_SIZE = 1024
+
+# Capacity planning
+# -----------------
+# How much memory we expect a PHP worker to take on average, in
+# megabytes. See CapacityPlanner.
+DEFAULT_PHP_PROCESS_MEMORY = 64
+
+# Profiling
+# ---------
+DEFAULT_PROFILE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'profiles')
+
 # Apache
 # ------
 DEFAULT_APACHE_VHOST_NAME = '000-default'
@@ -50,6 +95,20 @@ DEFAULT_APACHE_SERVER_NAME = 'localhost'
 DEFAULT_APACHE_SERVER_ADMIN = 'webmaster@localhost'
 DEFAULT_APACHE_DOCUMENT_ROOT = '/var/www/html'
 
+# SSL
+# ---
+# In days. Certbot only runs again when the certificate expires
+# within this window, or when the domains change.
+DEFAULT_SSL_RENEWAL_WINDOW = 30
+# ECDSA P-256 keys make for much cheaper handshakes than RSA keys,
+# and all current clients support them.
+DEFAULT_SSL_KEY_TYPE = 'ecdsa'
+SUPPORTED_SSL_KEY_TYPES = ['ecdsa', 'rsa']
+# Whether these have anything to do depends on when they run, because
+# certificates expire, so they never converge. Their checks are cheap.
+# See Lampsible.get_role_fingerprints.
+SSL_ROLES = ['ssl-selfsigned', 'ssl-certbot']
+
 # Database
 # --------
 DEFAULT_DATABASE_ENGINE       = 'mysql'
@@ -65,6 +124,20 @@ SUPPORTED_PHP_VERSIONS = [
     '7.4', '7.3', '7.2', '7.1', '7.0',
     '5.6', '5.5', '5.4',
 ]
+# OPcache can preload scripts as of PHP 7.4, and compile them
+# to machine code as of PHP 8.0.
+PHP_PRELOAD_VERSIONS = [
+    version for version in SUPPORTED_PHP_VERSIONS
+    if tuple(int(part) for part in version.split('.')) >= (7, 4)
+]
+PHP_JIT_VERSIONS = [
+    version for version in SUPPORTED_PHP_VERSIONS
+    if int(version.split('.')[0]) >= 8
+]
+
+# Object cache
+# ------------
+SUPPORTED_OBJECT_CACHES = ['redis', 'memcached']
 
 # All CMS
 # -------
@@ -76,6 +149,7 @@ DEFAULT_ADMIN_EMAIL    = 'admin@example.com'
 # ---------
 DEFAULT_WORDPRESS_VERSION = 'latest'
 DEFAULT_WORDPRESS_LOCALE  = 'en_US'
+DEFAULT_WP_CLI_VERSION    = '2.11.0'
 RECENT_WORDPRESS_VERSIONS = [
     'latest',
     'nightly',
@@ -0,0 +1,104 @@
+import os
+import json
+from re import match, escape
+from time import time
+from .constants import *
+
+
+class FactCache:
+    """Persistent, controller side cache of Ansible facts, one file per host.
+
+    This is the same directory that Ansible's 'jsonfile' cache plugin writes
+    to, so Ansible Runner and the playbooks read from it as well. With
+    'smart' gathering, Ansible only runs the setup module on a cache miss.
+    The directory lives outside of the private data dir, so it survives
+    PrivateData.cleanup_dir().
+    """
+
+    def __init__(self, cache_dir=DEFAULT_FACT_CACHE_DIR,
+            ttl=DEFAULT_FACT_CACHE_TTL):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.ttl       = ttl
+        try:
+            os.makedirs(self.cache_dir)
+        except FileExistsError:
+            pass
+
+
+    def get_dir_path(self):
+        return self.cache_dir
+
+
+    def get_runner_envvars(self):
+        return {
+            'ANSIBLE_GATHERING':            'smart',
+            'ANSIBLE_CACHE_PLUGIN_TIMEOUT': str(self.ttl),
+        }
+
+
+    def _get_cache_files(self, host):
+        # Ansible 2.19 and newer prefix the file name with a schema id,
+        # like 's1_somehost.com', older versions just use the host name.
+        return [
+            os.path.join(self.cache_dir, filename)
+            for filename in os.listdir(self.cache_dir)
+            if match(r'^(s\d+_)?{}$'.format(escape(host)), filename)
+        ]
+
+
+    def has_expired(self, cache_file):
+        # Like Ansible, a TTL of 0 means that facts never expire.
+        return self.ttl > 0 \
+            and time() - os.path.getmtime(cache_file) > self.ttl
+
+
+    @staticmethod
+    def _untag(tmp_dict):
+        # Ansible 2.19 and newer store some values along with metadata,
+        # like {'value': '24', '__ansible_type': '_AnsibleTaggedStr', ...}
+        if '__ansible_type' in tmp_dict and 'value' in tmp_dict:
+            return tmp_dict['value']
+        return tmp_dict
+
+
+    def get_facts(self, host):
+        """Returns the cached facts of the host, or an empty dictionary
+        if we have none, or they have expired.
+        """
+        facts = {}
+        for cache_file in sorted(
+            self._get_cache_files(host),
+            key=os.path.getmtime
+        ):
+            if self.has_expired(cache_file):
+                continue
+            try:
+                with open(cache_file, 'r') as stream:
+                    tmp_facts = json.load(stream)
+                if '__payload__' in tmp_facts:
+                    tmp_facts = json.loads(
+                        tmp_facts['__payload__'],
+                        object_hook=self._untag
+                    )
+                facts.update(tmp_facts)
+            except (ValueError, OSError):
+                pass
+        return facts
+
+
+    def invalidate(self, host=None):
+        """Deletes the cached facts of the host, or of all hosts
+        if no host is given.
+        """
+        if host:
+            cache_files = self._get_cache_files(host)
+        else:
+            cache_files = [
+                os.path.join(self.cache_dir, filename)
+                for filename in os.listdir(self.cache_dir)
+            ]
+        for cache_file in cache_files:
+            try:
+                os.remove(cache_file)
+            except FileNotFoundError:
+                pass
@@ -1,68 +1,235 @@
 import os
-from sys import path as sys_path
-from yaml import safe_load
-from ansible_runner import run_command
+import re
+import sys
+import json
+from glob import glob
+from hashlib import sha256
 from .constants import *
 
 
-def find_package_project_dir():
-    for path_str in sys_path:
+def get_collections_paths(user_home_dir):
+    """Returns the directories in which Ansible looks for collections,
+    roughly in the same order as Ansible itself. Each of them may contain
+    an 'ansible_collections' directory.
+    """
+    paths = []
+    for env_var in ['ANSIBLE_COLLECTIONS_PATH', 'ANSIBLE_COLLECTIONS_PATHS']:
+        paths.extend(filter(None, os.environ.get(env_var, '').split(':')))
+    paths.extend([
+        os.path.join(user_home_dir, '.ansible', 'collections'),
+        # Older versions of Lampsible checked this path.
+        os.path.join(user_home_dir, '.ansible'),
+        '/usr/share/ansible/collections',
+    ])
+    # Collections that come with the 'ansible' package from PyPI.
+    paths.extend(sys.path)
+    return [os.path.expanduser(path) for path in paths if path]
+
+
+def get_installed_collections(collections_paths):
+    """Reads the MANIFEST.json of each installed collection, without
+    spawning ansible-galaxy. Returns a dictionary that maps each
+    collection name to its version and manifest path. If a collection
+    is installed more than once, the first path wins, just like in Ansible.
+    """
+    installed = {}
+    for path in collections_paths:
+        for manifest_path in glob(os.path.join(
+            path, 'ansible_collections', '*', '*', 'MANIFEST.json'
+        )):
+            try:
+                with open(manifest_path, 'r') as f:
+                    info = json.load(f)['collection_info']
+                name = '{}.{}'.format(info['namespace'], info['name'])
+                version = info['version']
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            installed.setdefault(name, {
+                'version': version,
+                'manifest': manifest_path,
+            })
+    return installed
+
+
+def _version_tuple(version):
+    return tuple(int(part) for part in re.findall(r'\d+', version)[:3])
+
+
+def collection_version_matches(version, requirement):
+    """Checks a version against a requirement like '>=9.0.0,<10.0.0',
+    as found in Galaxy requirements files. An empty requirement or '*'
+    matches any version.
+    """
+    if not requirement or requirement == '*':
+        return True
+    operators = {
+        '>=': lambda a, b: a >= b,
+        '<=': lambda a, b: a <= b,
+        '!=': lambda a, b: a != b,
+        '==': lambda a, b: a == b,
+        '>':  lambda a, b: a > b,
+        '<':  lambda a, b: a < b,
+    }
+    for constraint in str(requirement).split(','):
+        constraint = constraint.strip()
+        operator = '=='
+        for tmp_operator in operators:
+            if constraint.startswith(tmp_operator):
+                operator = tmp_operator
+                constraint = constraint[len(tmp_operator):].strip()
+                break
+        if not operators[operator](
+            _version_tuple(version),
+            _version_tuple(constraint)
+        ):
+            return False
+    return True
+
+
+def get_missing_collections(required_collections, installed_collections):
+    missing_collections = []
+    for name, requirement in required_collections.items():
         try:
-            try_path = os.path.join(path_str, 'lampsible', 'project')
-            assert os.path.isdir(try_path)
-            return try_path
+            assert name in installed_collections
+            assert collection_version_matches(
+                installed_collections[name]['version'],
+                requirement
+            )
         except AssertionError:
-            pass
-    raise RuntimeError("Got no user supplied --project-dir, and could not find one in expected package location. Your Lampsible installation is likely broken. However, if you are running this code directly from source, this is expected behavior. You probably forgot to pass the '--project-dir' flag. The directoy you're looking for is 'src/lampsible/project/'.")
+            missing_collections.append(name)
+    return missing_collections
+
+
+def read_galaxy_stamp(stamp_file, requirements_hash):
+    """Returns True if a previous run found all requirements with the
+    same hash installed, and their manifests are still in place.
+    """
+    try:
+        with open(stamp_file, 'r') as f:
+            stamp = json.load(f)
+        assert stamp['requirements_hash'] == requirements_hash
+        for collection in stamp['collections'].values():
+            assert os.path.isfile(collection['manifest'])
+        return True
+    except (OSError, ValueError, KeyError, TypeError, AssertionError):
+        return False
+
+
+def write_galaxy_stamp(stamp_file, requirements_hash, collections):
+    try:
+        os.makedirs(os.path.dirname(stamp_file), exist_ok=True)
+        with open(stamp_file, 'w') as f:
+            json.dump({
+                'requirements_hash': requirements_hash,
+                'collections': collections,
+            }, f, indent=2)
+    except OSError:
+        # The stamp only saves time, so we can do without it.
+        pass
 
 
 # TODO: I want to make USER_HOME_DIR accessible globally, but can't figure it out right now :-(
 # So I had to add the argument user_home_dir
-def ensure_ansible_galaxy_dependencies(galaxy_requirements_file, user_home_dir):
-    with open(galaxy_requirements_file, 'r') as stream:
-        required_collections = []
-        tmp_collections = safe_load(stream)['collections']
-        for tmp_dict in tmp_collections:
-            required_collections.append(tmp_dict['name'])
-
-    # TODO There might be a more elegant way to do this - Right now,
-    # we're expecting required_collections to always be a tuple,
-    # and searching for requirements in a big string, but yaml/dict
-    # would be better.
-    installed_collections = run_command(
-        executable_cmd='ansible-galaxy',
-        cmdline_args=[
-            'collection',
-            'list',
-            '--collections-path',
-            os.path.join(user_home_dir, '.ansible'),
-        ],
-        quiet=True
-    )[0]
-    missing_collections = []
-    for required in required_collections:
-        if required not in installed_collections:
-            missing_collections.append(required)
-    if len(missing_collections) == 0:
+def ensure_ansible_galaxy_dependencies(galaxy_requirements_file, user_home_dir,
+    stamp_file=DEFAULT_GALAXY_STAMP_FILE, offline_dir=None):
+
+    with open(galaxy_requirements_file, 'rb') as f:
+        requirements_bytes = f.read()
+    requirements_hash = sha256(requirements_bytes).hexdigest()
+    if stamp_file and read_galaxy_stamp(stamp_file, requirements_hash):
         return 0
-    else:
-        return install_galaxy_collections(missing_collections, user_home_dir)
+
+    from yaml import safe_load
+    required_collections = {}
+    for tmp_dict in safe_load(requirements_bytes)['collections']:
+        required_collections[tmp_dict['name']] = tmp_dict.get('version')
+
+    collections_paths = get_collections_paths(user_home_dir)
+    installed_collections = get_installed_collections(collections_paths)
+    missing_collections = get_missing_collections(
+        required_collections,
+        installed_collections
+    )
+
+    if len(missing_collections) > 0:
+        result = install_galaxy_collections(
+            missing_collections,
+            user_home_dir,
+            offline_dir
+        )
+        if result != 0:
+            return result
+        installed_collections = get_installed_collections(collections_paths)
+        if get_missing_collections(
+            required_collections,
+            installed_collections
+        ):
+            # Installed somewhere we don't look, or in a version that
+            # doesn't satisfy the requirements. Let Ansible decide,
+            # but don't remember this as a good state.
+            return 0
+
+    if stamp_file:
+        write_galaxy_stamp(stamp_file, requirements_hash, {
+            name: installed_collections[name]
+            for name in required_collections
+        })
+    return 0
+
+
+def find_offline_collection_tarballs(collections, offline_dir):
+    """Finds tarballs as downloaded by 'ansible-galaxy collection download',
+    which are named like community-general-10.2.0.tar.gz. If there are
+    several versions of a collection, the newest one is picked.
+    """
+    tarballs = []
+    missing  = []
+    for collection in collections:
+        candidates = glob(os.path.join(
+            offline_dir,
+            '{}-*.tar.gz'.format(collection.replace('.', '-'))
+        ))
+        if not candidates:
+            missing.append(collection)
+            continue
+        tarballs.append(max(
+            candidates,
+            key=lambda path: _version_tuple(os.path.basename(path))
+        ))
+    return tarballs, missing
 
 
 # TODO: Again, see above about USER_HOME_DIR. However, I will
 # refactor the Galaxy stuff soon anyway.
-def install_galaxy_collections(collections, user_home_dir):
-    ok_to_install = input("\nI have to download and install the following Ansible Galaxy dependencies into {}:\n- {}\nIs this OK (yes/no)? ".format(
+def install_galaxy_collections(collections, user_home_dir, offline_dir=None):
+    if offline_dir:
+        install_args, missing = find_offline_collection_tarballs(
+            collections,
+            offline_dir
+        )
+        if missing:
+            print('Could not find the following Ansible Galaxy collections in {}:\n- {}'.format(
+                offline_dir,
+                '\n- '.join(missing)
+            ))
+            print('Cannot run Ansible plays without Galaxy requirements. Aborting.')
+            return 1
+        install_args.append('--offline')
+    else:
+        install_args = collections
+
+    ok_to_install = input("\nI have to install the following Ansible Galaxy dependencies into {}:\n- {}\nIs this OK (yes/no)? ".format(
         os.path.join(user_home_dir, '.ansible/'),
         '\n- '.join(collections)
     )).lower()
     while ok_to_install != 'yes' and ok_to_install != 'no':
         ok_to_install = input("Please type 'yes' or 'no': ")
     if ok_to_install == 'yes':
+        from ansible_runner import run_command
         print('\nInstalling Ansible Galaxy collections...')
         run_command(
             executable_cmd='ansible-galaxy',
-            cmdline_args=['collection', 'install'] + collections,
+            cmdline_args=['collection', 'install'] + install_args,
         )
         print('\n... collections installed.')
         return 0
@@ -1,11 +1,22 @@
 import os
+import re
+import json
+import tarfile
+from hashlib import sha256
 from copy import deepcopy
 from ansible_runner import (
     Runner, RunnerConfig, run_command, run as ansible_runner_run
 )
 from ansible_directory_helper.private_data import PrivateData
 from fqdn import FQDN
+from yaml import safe_load
 from .constants import *
+from .fact_cache import FactCache
+from .artifact_cache import ArtifactCache
+from .build_sync import BuildSync
+from .async_run import AsyncRun
+from .profiler import Profiler
+from .capacity_planner import CapacityPlanner
 
 
 class Lampsible:
@@ -29,6 +40,7 @@ class Lampsible:
             ssh_key_file=None, apache_vhost_name=DEFAULT_APACHE_VHOST_NAME,
             apache_document_root=DEFAULT_APACHE_DOCUMENT_ROOT, database_password=None,
             database_table_prefix=DEFAULT_DATABASE_TABLE_PREFIX, php_extensions=[],
+            php_fpm=False, object_cache=None, http_performance=False,
             composer_packages=[], composer_working_directory=None,
             composer_project=None, admin_password=None,
             wordpress_insecure_allow_xmlrpc=False,
@@ -36,12 +48,50 @@ class Lampsible:
             laravel_artisan_commands=DEFAULT_LARAVEL_ARTISAN_COMMANDS,
             email_for_ssl=None,
             domains_for_ssl=[], ssl_test_cert=False,
+            ssl_renewal_window=DEFAULT_SSL_RENEWAL_WINDOW, acme_server=None,
+            acme_ca_bundle=None,
+            ssl_key_type=DEFAULT_SSL_KEY_TYPE,
             extra_packages=[], extra_env_vars={},
             apache_custom_conf_name='',
+            web_hosts=None, forks=DEFAULT_FORKS,
+            fact_cache_dir=DEFAULT_FACT_CACHE_DIR,
+            fact_cache_ttl=DEFAULT_FACT_CACHE_TTL,
+            fast_transport=True,
+            profile=False, profile_dir=DEFAULT_PROFILE_DIR,
+            artifact_cache_dir=DEFAULT_ARTIFACT_CACHE_DIR,
+            artifact_cache_max_size=DEFAULT_ARTIFACT_CACHE_MAX_SIZE,
+            offline=False,
+            wp_cli_version=DEFAULT_WP_CLI_VERSION,
+            app_build_sync=True,
+            composer_cache_dir=None,
+            converge=True, force_roles=[],
             ):
 
-        self.web_user = web_user
-        self.web_host = web_host
+        # Fleet mode: If we got a list of hosts, they all go into one
+        # inventory, and we run one playbook against all of them at once.
+        # Entries can be 'user@host', or just 'host', in which case
+        # we fall back to web_user.
+        if web_hosts:
+            self.web_hosts = []
+            for user_host in web_hosts:
+                try:
+                    tmp_user, tmp_host = user_host.split('@')
+                except ValueError:
+                    tmp_user, tmp_host = web_user, user_host
+                self.web_hosts.append((tmp_user, tmp_host))
+            self.web_user, self.web_host = self.web_hosts[0]
+        else:
+            self.web_user  = web_user
+            self.web_host  = web_host
+            self.web_hosts = [(web_user, web_host)]
+        self.forks = forks
+
+        self.profile     = profile
+        self.profile_dir = profile_dir
+        self.profiler    = None
+
+        self.converge    = converge
+        self.force_roles = force_roles
 
         if database_system_user:
             self.database_system_user = database_system_user
@@ -55,9 +105,25 @@ class Lampsible:
         self.private_data_helper = PrivateData(private_data_dir)
         self._init_inventory()
 
+        self.fact_cache = FactCache(fact_cache_dir, fact_cache_ttl)
+
+        self.artifact_cache = ArtifactCache(
+            artifact_cache_dir,
+            artifact_cache_max_size * 1024 * 1024,
+            offline
+        )
+
+        envvars = self.fact_cache.get_runner_envvars()
+        self.fast_transport = fast_transport
+        if self.fast_transport:
+            envvars.update(self._get_transport_envvars())
+
         self.runner_config = RunnerConfig(
             private_data_dir=private_data_dir,
             project_dir=PROJECT_DIR,
+            forks=self.forks,
+            fact_cache=self.fact_cache.get_dir_path(),
+            envvars=envvars,
         )
 
         self.runner = Runner(config=self.runner_config)
@@ -65,12 +131,19 @@ class Lampsible:
         self.apache_document_root = apache_document_root
         self.apache_vhost_name    = apache_vhost_name
         self.apache_server_admin  = apache_server_admin
-
-        self.ssl_certbot     = ssl_certbot
-        self.ssl_test_cert   = ssl_test_cert
-        self.ssl_selfsigned  = ssl_selfsigned
-        self.email_for_ssl   = email_for_ssl
-        self.domains_for_ssl = domains_for_ssl
+        # HTTP/2, compression, cache headers for static files and sendfile,
+        # per virtual host, see roles/apache-vhosts.
+        self.http_performance     = http_performance
+
+        self.ssl_certbot        = ssl_certbot
+        self.ssl_test_cert      = ssl_test_cert
+        self.ssl_renewal_window = ssl_renewal_window
+        self.acme_server        = acme_server
+        self.acme_ca_bundle     = acme_ca_bundle
+        self.ssl_key_type       = ssl_key_type
+        self.ssl_selfsigned     = ssl_selfsigned
+        self.email_for_ssl      = email_for_ssl
+        self.domains_for_ssl    = domains_for_ssl
 
         self.apache_custom_conf_name = apache_custom_conf_name
 
@@ -81,10 +154,19 @@ class Lampsible:
         self.database_table_prefix = database_table_prefix
 
         self.php_version                = php_version
-        self.php_extensions             = php_extensions
-        self.composer_packages          = composer_packages
+        # Copies, because set_action adds to them.
+        self.php_extensions             = list(php_extensions or [])
+        self.php_fpm                    = php_fpm
+        self.object_cache               = object_cache
+        self.composer_packages          = list(composer_packages or [])
         self.composer_project           = composer_project
         self.composer_working_directory = composer_working_directory
+        if composer_cache_dir:
+            self.composer_cache_dir = os.path.abspath(composer_cache_dir)
+        else:
+            self.composer_cache_dir = None
+        # Set by _prepare_artifacts, if we have a composer_cache_dir.
+        self.composer_cache_archive = None
 
         self.set_action(action)
 
@@ -96,14 +178,25 @@ class Lampsible:
         self.wordpress_version = wordpress_version
         self.wordpress_locale  = wordpress_locale
         self.wordpress_insecure_allow_xmlrpc  = wordpress_insecure_allow_xmlrpc
+        self.wp_cli_version    = wp_cli_version
+        # These are set by _prepare_artifacts. If they remain None,
+        # the hosts download WordPress and WP-CLI themselves.
+        self.wordpress_archive          = None
+        self.wordpress_resolved_version = None
+        self.wp_cli_local_path          = None
 
         self.joomla_version = joomla_version
         self.joomla_admin_full_name = joomla_admin_full_name
+        # Set by _prepare_artifacts, just like wordpress_archive.
+        self.joomla_archive         = None
 
         self.drupal_profile = drupal_profile
 
         self.app_name = app_name
         self.app_build_path = app_build_path
+        self.app_build_sync = app_build_sync
+        # Set by _prepare_artifacts, if app_build_sync is enabled.
+        self.app_build_manifest = None
         self.laravel_artisan_commands = laravel_artisan_commands
         self.app_local_env = app_local_env
         self.extra_packages = extra_packages
@@ -166,6 +259,16 @@ class Lampsible:
             ]
         else:
             required_php_extensions = []
+
+        if self.object_cache:
+            required_php_extensions.append('php-{}'.format(self.object_cache))
+            if action == 'drupal':
+                module = 'drupal/{}'.format(
+                    'redis' if self.object_cache == 'redis' else 'memcache'
+                )
+                if module not in self.composer_packages:
+                    self.composer_packages.append(module)
+
         for ext in required_php_extensions:
             if ext not in self.php_extensions:
                 self.php_extensions.append(ext)
@@ -215,6 +318,11 @@ class Lampsible:
             'server_name':    server_name,
             'server_admin':   self.apache_server_admin,
             'allow_override': self.get_apache_allow_override(),
+            'php_fpm_pool':   self.apache_vhost_name,
+            'http2':          self.http_performance,
+            'compression':    self.http_performance,
+            'static_caching': self.http_performance,
+            'sendfile':       self.http_performance,
         }
 
         self.apache_vhosts = [base_vhost_dict]
@@ -240,6 +348,74 @@ class Lampsible:
             self.composer_working_directory = self.apache_document_root
 
 
+    def get_apt_packages(self):
+        """Returns the APT packages for PHP and its extensions, without
+        duplicates, so the 'apt' role can install them in one transaction.
+        Extensions might come in as 'php-mysql' or as 'php8.3-mysql',
+        which is the same thing if we're installing PHP 8.3.
+        """
+        if not self.installs_php():
+            return []
+
+        php_version = self.php_version or ''
+        if self.php_fpm:
+            # Without libapache2-mod-php, which 'php8.3' would pull in.
+            packages = [
+                'php{}-fpm'.format(php_version),
+                'php{}-cli'.format(php_version),
+            ]
+        else:
+            packages = ['php{}'.format(php_version)]
+        for extension in self.php_extensions:
+            if php_version and extension.startswith('php-'):
+                extension = 'php{}-{}'.format(php_version, extension[4:])
+            if extension not in packages:
+                packages.append(extension)
+        return packages
+
+
+    def installs_php(self):
+        return self.action in [
+            'lamp-stack',
+            'php',
+            'wordpress',
+            'joomla',
+            'drupal',
+            'laravel',
+        ]
+
+
+    def opcache_validates_timestamps(self):
+        # Laravel apps and Drupal only change when we deploy them, which
+        # resets OPcache, see handlers.yml. Everything else might change
+        # behind our back, like WordPress, which updates itself.
+        return self.app_local_env or self.action not in ['laravel', 'drupal']
+
+
+    def get_php_preload(self):
+        """Returns the directory of the Composer project whose framework
+        classes OPcache preloads, along with the paths of those classes,
+        relative to that directory. Returns None if there's nothing to
+        preload. See roles/php/templates/preload.php.j2.
+        """
+        if self.app_local_env:
+            return None
+        if self.action == 'laravel':
+            return {
+                'root':     '{}/{}'.format(
+                    DEFAULT_APACHE_DOCUMENT_ROOT,
+                    self.app_name
+                ),
+                'prefixes': ['vendor/laravel/framework/src/'],
+            }
+        if self.action == 'drupal':
+            return {
+                'root':     self.composer_working_directory,
+                'prefixes': ['web/core/lib/'],
+            }
+        return None
+
+
     def get_apache_allow_override(self):
         return (
             self.action in ['laravel', 'drupal']
@@ -255,20 +431,127 @@ class Lampsible:
         print(self.banner)
 
 
+    def is_fleet(self):
+        return len(self.web_hosts) > 1
+
+
+    def invalidate_fact_cache(self):
+        for _, web_host in self.web_hosts:
+            self.fact_cache.invalidate(web_host)
+        self.fact_cache.invalidate(self.database_system_host)
+
+
+    def get_database_hosts(self):
+        # In fleet mode, unless the user specified a dedicated database
+        # server, every web host gets its own database.
+        if self.is_fleet() and self.database_system_host == self.web_host:
+            return self.web_hosts
+        return [(self.database_system_user, self.database_system_host)]
+
+
+    def get_capacity_planners(self, php=None):
+        """Returns a dictionary mapping each host to a CapacityPlanner,
+        based on its cached facts. Hosts without cached facts are
+        gathered first. Hosts that we still don't have any facts for
+        are left out. Unless told otherwise, the web hosts run PHP if
+        the action installs it. The 'plan' action itself doesn't tell
+        us, and all apps need PHP, so it plans for PHP.
+        """
+        if php is None:
+            php = self.installs_php() or self.action == 'plan'
+        web_hosts      = [web_host for _, web_host in self.web_hosts]
+        database_hosts = [db_host for _, db_host in self.get_database_hosts()]
+        hosts          = list(dict.fromkeys(web_hosts + database_hosts))
+
+        if any(
+            'ansible_memtotal_mb' not in self.fact_cache.get_facts(host)
+            for host in hosts
+        ):
+            self._gather_facts()
+
+        planners = {}
+        for host in hosts:
+            try:
+                planners[host] = CapacityPlanner.from_facts(
+                    self.fact_cache.get_facts(host),
+                    web=host in web_hosts,
+                    database=host in database_hosts,
+                    php=php,
+                    php_fpm=self.php_fpm,
+                    object_cache=self.object_cache is not None
+                )
+            except KeyError:
+                continue
+        return planners
+
+
+    def _gather_facts(self):
+        """Runs the 'plan' action, which only gathers facts into the fact
+        cache, with a Runner of its own. Unlike run, this doesn't clean up
+        the private data dir, so that we can still run our own action.
+        """
+        action = self.action
+        self.set_action('plan')
+        try:
+            self._set_apache_vars()
+            self._update_env()
+            runner_config = RunnerConfig(
+                private_data_dir=self.runner_config.private_data_dir,
+                project_dir=PROJECT_DIR,
+                playbook=self.runner_config.playbook,
+                forks=self.forks,
+                fact_cache=self.fact_cache.get_dir_path(),
+                envvars=dict(self.runner_config.envvars),
+            )
+            runner_config.ssh_key_data = self.runner_config.ssh_key_data
+            runner_config.prepare()
+            runner = Runner(config=runner_config)
+            runner.run()
+            print(runner.stats)
+        finally:
+            self.set_action(action)
+
+
     def _init_inventory(self):
         self.private_data_helper.add_inventory_groups([
             'web_servers',
             'database_servers',
         ])
-        self.private_data_helper.add_inventory_host(self.web_host, 'web_servers')
-        self.private_data_helper.add_inventory_host(self.database_system_host,
-                'database_servers')
-        self.private_data_helper.set_inventory_ansible_user(self.web_host, self.web_user)
-        self.private_data_helper.set_inventory_ansible_user(
-                self.database_system_host, self.database_system_user)
+        for web_user, web_host in self.web_hosts:
+            self.private_data_helper.add_inventory_host(web_host, 'web_servers')
+            self.private_data_helper.set_inventory_ansible_user(web_host, web_user)
+
+        for db_user, db_host in self.get_database_hosts():
+            self.private_data_helper.add_inventory_host(db_host,
+                    'database_servers')
+            self.private_data_helper.set_inventory_ansible_user(db_host, db_user)
         self.private_data_helper.write_inventory()
 
 
+    def _get_transport_envvars(self):
+        """Returns the environment variables which keep SSH connections
+        open between tasks, and let Ansible pipe modules into the remote
+        Python interpreter, instead of copying them over as files first.
+        This also works with a sudo password, as long as 'requiretty' is
+        not set in the remote sudoers configuration, which it isn't on
+        Ubuntu. We don't write an ansible.cfg, so that the user's own
+        still applies, and we leave out anything that the user already
+        set in their environment.
+        """
+        envvars = {
+            'ANSIBLE_PIPELINING': 'True',
+            'ANSIBLE_SSH_ARGS': '-C -o ControlMaster=auto -o ControlPersist={}s -o ServerAliveInterval=15'.format(
+                DEFAULT_SSH_CONTROL_PERSIST
+            ),
+            'ANSIBLE_TIMEOUT': str(DEFAULT_ANSIBLE_TIMEOUT),
+            'ANSIBLE_FORKS': str(self.forks),
+        }
+        return {
+            name: value for name, value in envvars.items()
+            if name not in os.environ
+        }
+
+
     def _update_env(self):
         # TODO: Build this list conditionally, based on the action,
         # to avoid setting unnecessary variables. See ArgValidator.get_extravars_dict,
@@ -291,9 +574,19 @@ class Lampsible:
             'database_table_prefix',
             'php_version',
             'php_extensions',
+            'php_fpm',
+            'object_cache',
+            'php_preload',
+            'php_preload_versions',
+            'php_jit_versions',
+            'opcache_validate_timestamps',
+            'apt_packages',
             'composer_packages',
             'composer_project',
             'composer_working_directory',
+            'composer_cache_dir',
+            'composer_cache_archive',
+            'composer_classmap_authoritative',
             'site_title',
             'admin_username',
             'admin_password',
@@ -302,18 +595,29 @@ class Lampsible:
             'wordpress_locale',
             'wordpress_url',
             'wordpress_insecure_allow_xmlrpc',
+            'wordpress_archive',
+            'wordpress_resolved_version',
+            'wp_cli_local_path',
             'joomla_version',
             'joomla_admin_full_name',
+            'joomla_archive',
+            'joomla_package_url',
             'drupal_profile',
             'app_name',
             'app_build_path',
+            'app_build_manifest',
             'app_source_root',
             'laravel_artisan_commands',
             'app_local_env',
             'ssl_certbot',
             'email_for_ssl',
             'certbot_domains_string',
+            'certbot_domains',
             'ssl_test_cert',
+            'ssl_renewal_window',
+            'acme_server',
+            'acme_ca_bundle',
+            'ssl_key_type',
             'ssl_selfsigned',
             'extra_packages',
             'extra_env_vars',
@@ -323,7 +627,24 @@ class Lampsible:
             'ansible_sudo_pass',
             'open_database',
         ]
+        if self.is_fleet():
+            host_vars = {
+                web_host: self._get_host_vars(web_host)
+                for _, web_host in self.web_hosts
+            }
+        else:
+            host_vars = {}
+
+        # The values of the variables we pass to Ansible, from which
+        # we compute the role fingerprints, see get_role_fingerprints.
+        variables = {}
+
         for varname in extravars:
+            # In fleet mode, these differ from host to host, so they go
+            # into the inventory instead, see below.
+            if host_vars and varname in host_vars[self.web_host]:
+                continue
+
             if varname == 'server_name':
                 if FQDN.is_valid(self.web_host):
                     value = self.web_host
@@ -342,6 +663,9 @@ class Lampsible:
             elif varname == 'certbot_domains_string':
                 value = '-d {}'.format(' -d '.join(self.domains_for_ssl))
 
+            elif varname == 'certbot_domains':
+                value = self.domains_for_ssl
+
             # This lets us pass extra_env_vars to Lampsible in the more sensible dictionary format,
             # while still using them in the more convenient list format.
             elif varname == 'extra_env_vars':
@@ -360,6 +684,7 @@ class Lampsible:
                         'laravel_extra_env_vars',
                         value
                     )
+                    variables['laravel_extra_env_vars'] = value
                     value = []
 
             elif varname == 'app_source_root':
@@ -374,6 +699,38 @@ class Lampsible:
                 else:
                     continue
 
+            elif varname == 'joomla_package_url':
+                value = self.get_joomla_package_url()
+
+            # Drupal registers the namespaces of its modules at runtime,
+            # which an authoritative class map would ignore.
+            elif varname == 'composer_classmap_authoritative':
+                value = not (self.app_local_env or self.action == 'drupal')
+
+            elif varname == 'apt_packages':
+                value = self.get_apt_packages()
+
+            elif varname == 'php_fpm':
+                value = self.php_fpm and self.installs_php()
+
+            elif varname == 'php_preload':
+                value = self.get_php_preload()
+
+            elif varname == 'php_preload_versions':
+                value = PHP_PRELOAD_VERSIONS
+
+            elif varname == 'php_jit_versions':
+                value = PHP_JIT_VERSIONS
+
+            elif varname == 'opcache_validate_timestamps':
+                value = self.opcache_validates_timestamps()
+
+            elif varname == 'extra_packages':
+                value = [
+                    package for package in self.extra_packages
+                    if package not in self.get_apt_packages()
+                ]
+
             elif varname == 'open_database':
                 if self.database_system_host is None \
                         or self.database_system_host == self.web_host:
@@ -381,20 +738,304 @@ class Lampsible:
                 else:
                     value = True
 
-
-
             else:
                 value = getattr(self, varname)
 
             self.private_data_helper.set_extravar(varname, value)
+            variables[varname] = value
+
+        role_groups = self.get_playbook_roles()
+        self.private_data_helper.set_extravar('role_groups', role_groups)
+        self.private_data_helper.set_extravar('force_roles', self.force_roles)
+        if host_vars:
+            for web_host, tmp_vars in host_vars.items():
+                tmp_vars['role_fingerprints'] = self.get_role_fingerprints(
+                    dict(variables, **tmp_vars),
+                    role_groups
+                )
+        else:
+            self.private_data_helper.set_extravar(
+                'role_fingerprints',
+                self.get_role_fingerprints(variables, role_groups)
+            )
 
         self.private_data_helper.write_env()
 
+        for web_host, tmp_vars in host_vars.items():
+            for varname, value in tmp_vars.items():
+                self.private_data_helper.inventory_file.set_variable(
+                    web_host, varname, value)
+        if host_vars:
+            self.private_data_helper.write_inventory()
+
+
+    def get_playbook_roles(self):
+        """Returns a dictionary mapping each host group in the action's
+        playbook to the roles that the playbook includes for it.
+        """
+        try:
+            with open(os.path.join(
+                PROJECT_DIR,
+                self.runner_config.playbook
+            ), 'r') as f:
+                plays = safe_load(f)
+        except FileNotFoundError:
+            return {}
+
+        role_groups = {}
+        for play in plays:
+            if 'hosts' not in play:
+                continue
+            for task in play.get('tasks', []):
+                if 'include_role' not in task:
+                    continue
+                role_name = task['include_role']['name']
+                if '{{' in role_name:
+                    role_names = task.get('loop', [])
+                else:
+                    role_names = [role_name]
+                roles = role_groups.setdefault(play['hosts'], [])
+                for role in role_names:
+                    if role not in roles:
+                        roles.append(role)
+        return role_groups
+
+
+    def get_role_fingerprints(self, variables, role_groups):
+        """Returns a dictionary mapping each role in role_groups to a
+        hash of its inputs: its files, the action's playbook, and the
+        values of those variables that these reference. At the end of a
+        successful run, the hosts record these, and on the next run, the
+        playbooks skip the roles whose fingerprints are still the same.
+        The SSL roles get none, so they always run.
+        """
+        if not self.converge or not role_groups:
+            return {}
+
+        with open(os.path.join(
+            PROJECT_DIR,
+            self.runner_config.playbook
+        ), 'rb') as f:
+            playbook = f.read()
+
+        fingerprints = {}
+        for role in sorted(set(sum(role_groups.values(), [])) - set(SSL_ROLES)):
+            role_hash = sha256(playbook)
+            role_text = playbook.decode(errors='replace')
+            role_dir  = os.path.join(PROJECT_DIR, 'roles', role)
+            for dir_path, dir_names, file_names in os.walk(role_dir):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    file_path = os.path.join(dir_path, file_name)
+                    with open(file_path, 'rb') as f:
+                        content = f.read()
+                    role_hash.update(
+                        os.path.relpath(file_path, role_dir).encode())
+                    role_hash.update(content)
+                    role_text += content.decode(errors='replace')
+
+            role_words = set(re.findall(r'\w+', role_text))
+            used_variables = {
+                name: value for name, value in variables.items()
+                if name in role_words
+            }
+            role_hash.update(json.dumps(
+                used_variables,
+                sort_keys=True,
+                default=str
+            ).encode())
+            fingerprints[role] = role_hash.hexdigest()
+        return fingerprints
+
+
+    def _get_host_vars(self, web_host):
+        """Returns the variables which depend on the individual web host.
+        In fleet mode, we can't pass these as extravars, because those
+        would override the host vars of every host in the inventory.
+        """
+        if FQDN(web_host).is_valid:
+            server_name = web_host
+        else:
+            server_name = DEFAULT_APACHE_SERVER_NAME
+
+        apache_vhosts = deepcopy(self.apache_vhosts)
+        for vhost in apache_vhosts:
+            vhost['server_name'] = server_name
+
+        if not self.ssl_certbot or web_host[:4] == 'www.':
+            wordpress_url = web_host
+        else:
+            wordpress_url = 'www.{}'.format(web_host)
+
+        domains_for_ssl = [web_host]
+        if wordpress_url not in domains_for_ssl:
+            domains_for_ssl.append(wordpress_url)
+
+        return {
+            'web_host':               web_host,
+            'apache_vhosts':          apache_vhosts,
+            'wordpress_url':          wordpress_url,
+            'certbot_domains_string': '-d {}'.format(
+                ' -d '.join(domains_for_ssl)),
+            'certbot_domains':        domains_for_ssl,
+        }
+
 
     def _prepare_config(self):
         self.runner_config.prepare()
 
 
+    def _prepare_artifacts(self):
+        """Fetches the files that the action needs, like WordPress and
+        WP-CLI, or the Joomla package, into the artifact cache, unless
+        they're cached already, so that the hosts don't have to download
+        them. If that fails, we fall back to letting the hosts download
+        them, except in offline mode, where this raises a RuntimeError.
+        For Laravel, this writes the manifest of the app build instead.
+        """
+        try:
+            if self.action == 'wordpress':
+                self._prepare_wordpress_artifacts()
+            elif self.action == 'joomla':
+                self._prepare_joomla_artifacts()
+            elif self.action == 'laravel':
+                self._prepare_laravel_artifacts()
+            if self.composer_packages and self.composer_cache_dir:
+                self._prepare_composer_cache()
+        except RuntimeError as e:
+            if self.artifact_cache.offline:
+                raise
+            print('Warning! {} The hosts will download it themselves.'.format(e))
+            self.wordpress_archive          = None
+            self.wordpress_resolved_version = None
+            self.wp_cli_local_path          = None
+            self.joomla_archive             = None
+            self.composer_cache_archive     = None
+
+
+    def _prepare_wordpress_artifacts(self):
+        self.wp_cli_local_path = self.artifact_cache.fetch(
+            'wp-cli/{}'.format(self.wp_cli_version),
+            'https://github.com/wp-cli/wp-cli/releases/download/v{0}/wp-cli-{0}.phar'.format(
+                self.wp_cli_version),
+            'https://github.com/wp-cli/wp-cli/releases/download/v{0}/wp-cli-{0}.phar.sha512'.format(
+                self.wp_cli_version),
+            'sha512'
+        )
+
+        # Nightly builds change every day, so there's no point in
+        # caching them.
+        if self.wordpress_version == 'nightly':
+            return
+        version = self._resolve_wordpress_version()
+        if self.wordpress_locale == DEFAULT_WORDPRESS_LOCALE:
+            url = 'https://wordpress.org/wordpress-{}.tar.gz'.format(version)
+        else:
+            url = 'https://downloads.wordpress.org/release/{}/wordpress-{}.tar.gz'.format(
+                self.wordpress_locale,
+                version
+            )
+        # WP-CLI verifies its downloads against the same MD5 checksums,
+        # WordPress doesn't publish stronger ones for localized builds.
+        self.wordpress_archive = self.artifact_cache.fetch(
+            'wordpress/{}/{}'.format(version, self.wordpress_locale),
+            url,
+            '{}.md5'.format(url),
+            'md5'
+        )
+        self.wordpress_resolved_version = version
+
+
+    def _prepare_joomla_artifacts(self):
+        # Joomla only publishes its checksums on the release pages,
+        # so we can't verify the download against them.
+        self.joomla_archive = self.artifact_cache.fetch(
+            'joomla/{}'.format(self.joomla_version),
+            self.get_joomla_package_url()
+        )
+
+
+    def _prepare_laravel_artifacts(self):
+        """Writes the manifest of the app build into the private data
+        dir, so that the 'laravel' role can upload only what changed.
+        """
+        if not self.app_build_sync:
+            return
+        build_sync_dir = os.path.join(
+            os.path.abspath(self.private_data_helper.get_dir_path()),
+            'build-sync'
+        )
+        os.makedirs(build_sync_dir, exist_ok=True)
+        self.app_build_manifest = os.path.join(build_sync_dir, 'manifest.json')
+        BuildSync(self.app_build_path).write_manifest(self.app_build_manifest)
+
+
+    def _prepare_composer_cache(self):
+        """Packs the Composer cache on the controller into the private
+        data dir, so that the 'composer' role can seed the cache on the
+        hosts with it. The role brings new downloads back into it.
+        """
+        os.makedirs(self.composer_cache_dir, exist_ok=True)
+        members = [
+            member for member in ['files', 'repo']
+            if os.path.isdir(os.path.join(self.composer_cache_dir, member))
+        ]
+        if not members:
+            return
+        self.composer_cache_archive = os.path.join(
+            os.path.abspath(self.private_data_helper.get_dir_path()),
+            'composer-cache.tar.gz'
+        )
+        with tarfile.open(self.composer_cache_archive, 'w:gz') as archive:
+            for member in members:
+                archive.add(
+                    os.path.join(self.composer_cache_dir, member),
+                    arcname=member
+                )
+
+
+    def get_joomla_package_url(self):
+        dashed_version = self.joomla_version.replace('.', '-')
+        return 'https://downloads.joomla.org/cms/joomla{}/{}/Joomla_{}-Stable-Full_Package.tar.gz'.format(
+            self.joomla_version.split('.')[0],
+            dashed_version,
+            dashed_version
+        )
+
+
+    def _resolve_wordpress_version(self):
+        if self.wordpress_version != 'latest':
+            return self.wordpress_version
+
+        if self.artifact_cache.offline:
+            # The newest version we have cached for this locale.
+            versions = [
+                key.split('/')[1]
+                for key in self.artifact_cache.get_keys('wordpress/')
+                if key.endswith('/{}'.format(self.wordpress_locale))
+            ]
+            if not versions:
+                raise RuntimeError(
+                    'Got no cached WordPress for locale {}.'.format(
+                        self.wordpress_locale)
+                )
+            return max(versions, key=lambda version: [
+                int(part) for part in version.split('.') if part.isdigit()
+            ])
+
+        import requests
+        try:
+            r = requests.get(
+                'https://api.wordpress.org/core/version-check/1.7/',
+                timeout=30
+            )
+            r.raise_for_status()
+            return r.json()['offers'][0]['current']
+        except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+            raise RuntimeError(
+                'Could not resolve the latest WordPress version: {}'.format(e))
+
+
     # TODO: Do it this way?
     #def dump_ansible_facts(self):
     #    ansible_runner_run(
@@ -407,14 +1048,79 @@ class Lampsible:
 
     def run(self):
         self._set_apache_vars()
-        self._update_env()
-        self._prepare_config()
         try:
+            self._prepare_artifacts()
+            self._update_env()
+            self._prepare_config()
             self.runner.run()
             print(self.runner.stats)
-            self.private_data_helper.cleanup_dir()
+            result = self._finish_run()
+            if self.profiler:
+                self.profiler.print_report()
+                print('\nProfile written to {}'.format(
+                    self.get_profile_path()))
+            return result
+        except RuntimeError as e:
+            return self._get_error_result(e)
+
+
+    def run_async(self):
+        """Like run, but returns an AsyncRun, which you can await to get
+        the result, and which streams Ansible's events while it's running.
+        This has to be called from within a running asyncio event loop.
+        To run several deployments concurrently, give each Lampsible
+        object its own private_data_dir.
+        """
+        self._set_apache_vars()
+        try:
+            self._prepare_artifacts()
+            self._update_env()
+            self._prepare_config()
+        except RuntimeError as e:
+            return AsyncRun(self, error=e)
+        return AsyncRun(self)
+
+
+    def _get_error_result(self, error):
+        """Prints the error that a run ran into, and returns the
+        result of the failed run, for run as well as run_async.
+        """
+        print(error)
+        if self.is_fleet():
+            return {web_host: 1 for _, web_host in self.web_hosts}
+        return 1
+
+
+    def get_profile_path(self):
+        return os.path.join(self.profile_dir, self.runner_config.ident)
+
+
+    def _finish_run(self):
+        # Get the results and profile before cleaning up, because we read
+        # them from the artifacts in the private data dir.
+        if self.profile:
+            self.profiler = Profiler(self.runner.events)
+            self.profiler.write(self.get_profile_path())
+
+        if self.is_fleet():
+            result = self.get_host_results()
+        else:
             # TODO: We could do this better, like check the fact_cache and make sure
             # everything was alright, before returning 0.
-            return 0
-        except RuntimeError:
-            return 1
+            result = 0
+        self.private_data_helper.cleanup_dir()
+        return result
+
+
+    def get_host_results(self):
+        """Returns a dictionary mapping each web host to 0 if the
+        playbook ran through on that host, or 1 if it failed
+        or the host was unreachable.
+        """
+        stats = self.runner.stats or {}
+        failed_hosts = set(stats.get('failures', {})) \
+            | set(stats.get('dark', {}))
+        return {
+            web_host: 1 if web_host in failed_hosts else 0
+            for _, web_host in self.web_hosts
+        }
@@ -0,0 +1,199 @@
+import os
+import json
+from datetime import datetime
+
+
+class Profiler:
+    """Collects per task wall time from Ansible Runner's job events.
+
+    Tasks are identified by their task_uuid, and for each task, we keep the
+    time it took on each host, as well as its overall wall time, that is,
+    from when it started on the first host until it finished on the last.
+
+    We also pair up the tasks that start background jobs with the
+    async_status tasks that wait for them, by their ansible_job_id, to
+    find out how long each job ran alongside other tasks.
+    """
+
+    FINISHED_EVENTS = [
+        'runner_on_ok',
+        'runner_on_failed',
+        'runner_on_skipped',
+        'runner_on_unreachable',
+    ]
+
+    def __init__(self, events=[]):
+        self.tasks      = {}
+        self.async_jobs = {}
+        for event in events:
+            self.add_event(event)
+
+
+    def add_event(self, event):
+        if event.get('event') not in self.FINISHED_EVENTS:
+            return
+        event_data = event.get('event_data', {})
+        if not (event_data.get('start') and event_data.get('end')):
+            return
+
+        start = datetime.fromisoformat(event_data['start'])
+        end   = datetime.fromisoformat(event_data['end'])
+        task  = self.tasks.setdefault(event_data['task_uuid'], {
+            'play':  event_data.get('play') or '',
+            'role':  event_data.get('role') or '',
+            'task':  event_data.get('task') or '',
+            'start': start,
+            'end':   end,
+            'hosts': {},
+        })
+        task['start'] = min(task['start'], start)
+        task['end']   = max(task['end'], end)
+        task['hosts'][event_data['host']] = (end - start).total_seconds()
+
+        res = event_data.get('res')
+        if isinstance(res, dict) and res.get('ansible_job_id'):
+            job = self.async_jobs.setdefault(
+                (event_data['host'], res['ansible_job_id']), {})
+            if (event_data.get('task_action') or '').endswith('async_status'):
+                job['join_task']  = event_data['task_uuid']
+                job['join_start'] = start
+                job['join_end']   = end
+            else:
+                job['task']     = event_data['task_uuid']
+                job['launched'] = end
+
+
+    def get_async_jobs(self):
+        """Returns the background jobs, one entry per task that started
+        them, with the time that they overlapped with other tasks, from
+        when they were started until something started waiting for them,
+        and the time that something waited, on each host. If a job was
+        done before anything waited for it, the overlap includes the
+        time after it was done, so it's an upper bound.
+        """
+        jobs = {}
+        for (host, _), job in self.async_jobs.items():
+            if 'launched' not in job or 'join_start' not in job:
+                continue
+            task = self.tasks[job['task']]
+            entry = jobs.setdefault(job['task'], {
+                'play':      task['play'],
+                'role':      task['role'],
+                'task':      task['task'],
+                'joined_by': self.tasks[job['join_task']]['task'],
+                'overlap':   0,
+                'waited':    0,
+                'hosts':     {},
+            })
+            overlap = max(
+                (job['join_start'] - job['launched']).total_seconds(), 0)
+            waited  = (job['join_end'] - job['join_start']).total_seconds()
+            entry['overlap'] = max(entry['overlap'], overlap)
+            entry['waited']  = max(entry['waited'], waited)
+            entry['hosts'][host] = {'overlap': overlap, 'waited': waited}
+        return sorted(
+            jobs.values(),
+            key=lambda job: job['overlap'],
+            reverse=True
+        )
+
+
+    def get_report(self):
+        tasks = sorted([
+            {
+                'play':      task['play'],
+                'role':      task['role'],
+                'task':      task['task'],
+                'start':     task['start'].isoformat(),
+                'end':       task['end'].isoformat(),
+                'wall_time': (task['end'] - task['start']).total_seconds(),
+                'hosts':     task['hosts'],
+            } for task in self.tasks.values()
+        ], key=lambda task: task['wall_time'], reverse=True)
+
+        role_times = {}
+        for task in tasks:
+            role_times[task['role']] = role_times.get(task['role'], 0) \
+                + task['wall_time']
+        roles = sorted([
+            {'role': role, 'wall_time': wall_time}
+            for role, wall_time in role_times.items()
+        ], key=lambda role: role['wall_time'], reverse=True)
+
+        if self.tasks:
+            total = (
+                max(task['end'] for task in self.tasks.values())
+                - min(task['start'] for task in self.tasks.values())
+            ).total_seconds()
+        else:
+            total = 0
+
+        async_jobs = self.get_async_jobs()
+
+        return {
+            'total_wall_time': total,
+            'total_overlap': sum(job['overlap'] for job in async_jobs),
+            'roles': roles,
+            'tasks': tasks,
+            'async_jobs': async_jobs,
+        }
+
+
+    def get_folded_stacks(self):
+        """Returns the timings in the 'folded stacks' format that
+        flamegraph.pl and similar tools understand, one line per
+        play, role, task and host, with the time in milliseconds.
+        """
+        lines = []
+        for task in self.tasks.values():
+            for host, duration in task['hosts'].items():
+                frames = [
+                    task['play'],
+                    task['role'] or '(no role)',
+                    task['task'],
+                    host,
+                ]
+                lines.append('{} {}'.format(
+                    ';'.join(frame.replace(';', ',') for frame in frames),
+                    round(duration * 1000)
+                ))
+        return lines
+
+
+    def write(self, dir_path):
+        try:
+            os.makedirs(dir_path)
+        except FileExistsError:
+            pass
+        with open(os.path.join(dir_path, 'profile.json'), 'w') as f:
+            json.dump(self.get_report(), f, indent=2)
+        with open(os.path.join(dir_path, 'profile.folded'), 'w') as f:
+            f.write('\n'.join(self.get_folded_stacks()) + '\n')
+
+
+    def print_report(self, limit=10):
+        report = self.get_report()
+        print('\nTotal: {:.1f}s'.format(report['total_wall_time']))
+        print('\nSlowest roles:')
+        for role in report['roles'][:limit]:
+            print('{:>9.1f}s  {}'.format(
+                role['wall_time'],
+                role['role'] or '(no role)'
+            ))
+        print('\nSlowest tasks:')
+        for task in report['tasks'][:limit]:
+            print('{:>9.1f}s  {} : {}'.format(
+                task['wall_time'],
+                task['role'] or task['play'],
+                task['task']
+            ))
+        if report['async_jobs']:
+            print('\nIn the background, alongside other tasks:')
+            for job in report['async_jobs'][:limit]:
+                print('{:>9.1f}s  {} : {} (then waited {:.1f}s)'.format(
+                    job['overlap'],
+                    job['role'] or job['play'],
+                    job['task'],
+                    job['waited']
+                ))
+            print('{:>9.1f}s  in total'.format(report['total_overlap']))
@@ -0,0 +1,42 @@
+"""Jinja filters for the playbooks, so that they can use Lampsible's own
+logic without starting a Python process for it on every run.
+
+The project dir lives inside the lampsible package, so we import the
+package from there, even if the Python that runs Ansible doesn't have
+it installed.
+"""
+import os
+import sys
+
+PACKAGE_PARENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))
+)))
+if PACKAGE_PARENT_DIR not in sys.path:
+    sys.path.append(PACKAGE_PARENT_DIR)
+
+from lampsible.capacity_planner import CapacityPlanner
+from lampsible.certificate_check import CertificateCheck
+
+
+def capacity_plan(memory_mb, vcpus=1, **kwargs):
+    """See CapacityPlanner.get_plan."""
+    return CapacityPlanner(memory_mb, vcpus, **kwargs).get_plan()
+
+
+def certbot_decision(text, domains, key_type, expiring=False):
+    """See CertificateCheck.get_decision."""
+    return CertificateCheck(
+        text,
+        domains,
+        key_type=key_type,
+        expiring=expiring
+    ).get_decision()
+
+
+class FilterModule:
+
+    def filters(self):
+        return {
+            'capacity_plan'   : capacity_plan,
+            'certbot_decision': certbot_decision,
+        }
@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+import subprocess
+from tempfile import TemporaryDirectory
+from lampsible.artifact_cache import ArtifactCache
+
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.artifact_cache = ArtifactCache(
+            os.path.join(self.tmp_dir.name, 'cache'), 10)
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def _put(self, key, content):
+        tmp_path = os.path.join(self.tmp_dir.name, 'tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        return self.artifact_cache.put(key, tmp_path)
+
+
+    def test_put_and_get(self):
+        path = self._put('wordpress/6.7.1/en_US', 'abcd')
+        self.assertEqual(self.artifact_cache.get('wordpress/6.7.1/en_US'), path)
+        self.assertEqual(os.path.basename(path),
+            ArtifactCache.get_file_hash(path))
+        self.assertIsNone(self.artifact_cache.get('wordpress/6.7/en_US'))
+
+        # A corrupted file is not served.
+        with open(path, 'w') as f:
+            f.write('efgh')
+        self.assertIsNone(self.artifact_cache.get('wordpress/6.7.1/en_US'))
+
+
+    def test_corrupted_without_asserts(self):
+        path = self._put('one', 'aaaa')
+        with open(path, 'w') as f:
+            f.write('bbbb')
+        # 'python -O' strips asserts, the hash check must still hold.
+        result = subprocess.run([
+            sys.executable, '-O', '-c',
+            'import sys; from lampsible.artifact_cache import ArtifactCache; '
+            'print(ArtifactCache(sys.argv[1], 10).get("one"))',
+            os.path.join(self.tmp_dir.name, 'cache'),
+        ], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), 'None')
+
+
+    def test_eviction(self):
+        self._put('one', 'aaaa')
+        self._put('two', 'bbbb')
+        self.artifact_cache.get('one')
+        # This exceeds the 10 bytes, so 'two', which was used least
+        # recently, has to go.
+        self._put('three', 'cccc')
+        self.assertIsNotNone(self.artifact_cache.get('one'))
+        self.assertIsNone(self.artifact_cache.get('two'))
+        self.assertIsNotNone(self.artifact_cache.get('three'))
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.tmp_dir.name, 'cache', 'blobs'))),
+            2
+        )
+
+
+    def test_offline(self):
+        self.artifact_cache.offline = True
+        path = self._put('wp-cli/2.11.0', 'abcd')
+        self.assertEqual(self.artifact_cache.fetch(
+            'wp-cli/2.11.0', 'https://example.com/wp-cli.phar'), path)
+        with self.assertRaises(RuntimeError):
+            self.artifact_cache.fetch(
+                'wp-cli/2.10.0', 'https://example.com/wp-cli.phar')
@@ -0,0 +1,107 @@
+import io
+import os
+import sys
+import json
+import tarfile
+import unittest
+import subprocess
+from tempfile import TemporaryDirectory
+from lampsible.build_sync import BuildSync
+
+
+class TestBuildSync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def _write_build(self, filename, files, prefix=''):
+        path = os.path.join(self.tmp_dir.name, filename)
+        with tarfile.open(path, 'w:gz') as archive:
+            directory = tarfile.TarInfo('{}some-app'.format(prefix))
+            directory.type = tarfile.DIRTYPE
+            archive.addfile(directory)
+            for name, content in files.items():
+                member = tarfile.TarInfo('{}some-app/{}'.format(prefix, name))
+                member.size = len(content)
+                archive.addfile(member, io.BytesIO(content))
+        return path
+
+
+    def test_delta(self):
+        old_build = BuildSync(self._write_build('some-app-1.0.tar.gz', {
+            'artisan': b'artisan',
+            'app/Foo.php': b'foo',
+            'app/Bar.php': b'bar',
+        }))
+        new_build = BuildSync(self._write_build('some-app-2.0.tar.gz', {
+            'artisan': b'artisan',
+            'app/Foo.php': b'changed foo',
+            'app/Baz.php': b'baz',
+        }))
+        old_manifest = old_build.get_manifest()
+        new_manifest = new_build.write_manifest(
+            os.path.join(self.tmp_dir.name, 'manifest.json'))
+        self.assertEqual(len(new_manifest), 4)
+
+        delta_path = os.path.join(self.tmp_dir.name, 'delta.tar.gz')
+        changed, deleted = new_build.write_delta(
+            new_manifest, old_manifest, delta_path)
+        self.assertEqual(
+            sorted(changed), ['some-app/app/Baz.php', 'some-app/app/Foo.php'])
+        self.assertEqual(deleted, ['some-app/app/Bar.php'])
+        with tarfile.open(delta_path, 'r:gz') as delta:
+            self.assertEqual(
+                delta.extractfile('some-app/app/Foo.php').read(), b'changed foo')
+            self.assertEqual(len(delta.getmembers()), 2)
+
+
+    def test_normalized_names(self):
+        old_build = BuildSync(self._write_build('some-app-1.0.tar.gz', {
+            'artisan': b'artisan',
+            'app': b'was a file',
+        }, './'))
+        new_build = BuildSync(self._write_build('some-app-2.0.tar.gz', {
+            'artisan': b'artisan',
+            'app/Foo.php': b'foo',
+        }))
+        new_manifest = new_build.get_manifest()
+        self.assertIn('some-app/artisan', new_manifest)
+        changed, deleted = new_build.write_delta(
+            new_manifest,
+            old_build.get_manifest(),
+            os.path.join(self.tmp_dir.name, 'delta.tar.gz')
+        )
+        self.assertEqual(changed, ['some-app/app/Foo.php'])
+        self.assertEqual(deleted, [])
+
+        # Remote manifests written by older versions kept the './' prefix.
+        remote_manifest = {
+            './{}'.format(name): content
+            for name, content in new_manifest.items()
+        }
+        remote_manifest['./some-app/app/Bar.php'] = 'x'
+        changed, deleted = new_build.write_delta(
+            new_manifest,
+            remote_manifest,
+            os.path.join(self.tmp_dir.name, 'delta.tar.gz')
+        )
+        self.assertEqual(changed, [])
+        self.assertEqual(deleted, ['some-app/app/Bar.php'])
+
+
+    def test_first_deploy(self):
+        build_path = self._write_build('some-app-1.0.tar.gz', {'artisan': b'a'})
+        manifest_path = os.path.join(self.tmp_dir.name, 'manifest.json')
+        BuildSync(build_path).write_manifest(manifest_path)
+        result = subprocess.run([
+            sys.executable, '-m', 'lampsible.build_sync',
+            '--archive', build_path,
+            '--manifest', manifest_path,
+            '--output', os.path.join(self.tmp_dir.name, 'delta.tar.gz'),
+        ], input='', capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(result.stdout)['changed'], 2)
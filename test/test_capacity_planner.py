@@ -0,0 +1,99 @@
+import sys
+import json
+import unittest
+import subprocess
+from lampsible.capacity_planner import CapacityPlanner
+
+
+class TestCapacityPlanner(unittest.TestCase):
+
+    def test_shared_host(self):
+        plan = CapacityPlanner(4096, 2).get_plan()
+        self.assertEqual(
+            plan['web_memory'] + plan['database_memory'] + plan['reserved_memory'],
+            4096
+        )
+        self.assertEqual(plan['apache_mpm'], 'prefork')
+        self.assertEqual(
+            plan['apache_max_request_workers'],
+            plan['php_workers']
+        )
+        self.assertLessEqual(
+            plan['opcache_memory'] + plan['opcache_jit_buffer_size']
+            + plan['php_workers'] * 64,
+            plan['web_memory']
+        )
+        self.assertEqual(
+            plan['mysql_max_connections'],
+            plan['php_workers'] + 20
+        )
+        self.assertLess(
+            plan['mysql_innodb_buffer_pool_size'],
+            plan['database_memory']
+        )
+
+
+    def test_dedicated_hosts(self):
+        web_plan = CapacityPlanner(4096, 2, database=False).get_plan()
+        shared_plan = CapacityPlanner(4096, 2).get_plan()
+        self.assertEqual(web_plan['database_memory'], 0)
+        self.assertNotIn('mysql_max_connections', web_plan)
+        self.assertGreater(web_plan['php_workers'], shared_plan['php_workers'])
+
+        database_plan = CapacityPlanner(4096, 2, web=False).get_plan()
+        self.assertNotIn('apache_mpm', database_plan)
+        self.assertGreater(
+            database_plan['mysql_innodb_buffer_pool_size'],
+            shared_plan['mysql_innodb_buffer_pool_size']
+        )
+
+
+    def test_object_cache(self):
+        plan = CapacityPlanner(4096, 2, object_cache=True).get_plan()
+        shared_plan = CapacityPlanner(4096, 2).get_plan()
+        self.assertGreaterEqual(plan['object_cache_memory'], 32)
+        self.assertLess(plan['php_workers'], shared_plan['php_workers'])
+        self.assertNotIn(
+            'object_cache_memory',
+            CapacityPlanner(4096, 2, web=False, object_cache=True).get_plan()
+        )
+
+
+    def test_php_fpm(self):
+        plan = CapacityPlanner(8192, 4, php_fpm=True, php_fpm_pools=2).get_plan()
+        self.assertEqual(plan['apache_mpm'], 'event')
+        self.assertEqual(
+            plan['apache_server_limit'] * plan['apache_threads_per_child'],
+            plan['apache_max_request_workers']
+        )
+        self.assertGreaterEqual(
+            plan['apache_max_request_workers'],
+            plan['php_workers']
+        )
+        self.assertLessEqual(
+            plan['php_fpm_max_children'] * plan['php_fpm_pools'],
+            plan['php_workers']
+        )
+        self.assertLessEqual(
+            plan['php_fpm_min_spare_servers'],
+            plan['php_fpm_start_servers']
+        )
+        self.assertLessEqual(
+            plan['php_fpm_start_servers'],
+            plan['php_fpm_max_spare_servers']
+        )
+
+
+    def test_main(self):
+        result = subprocess.run([
+            sys.executable, '-m', 'lampsible.capacity_planner',
+            '--memory-mb', '1024',
+            '--vcpus', '1',
+            '--web',
+            '--database',
+            '--php',
+        ], capture_output=True, text=True, check=True)
+        self.assertEqual(
+            json.loads(result.stdout),
+            CapacityPlanner(1024, 1).get_plan()
+        )
@@ -0,0 +1,60 @@
+import sys
+import json
+import unittest
+import subprocess
+from lampsible.certificate_check import CertificateCheck
+
+# Abridged output of 'openssl x509 -text'.
+CERTIFICATE_TEXT = """Certificate:
+    Data:
+        Subject Public Key Info:
+            Public Key Algorithm: id-ecPublicKey
+                Public-Key: (256 bit)
+        X509v3 extensions:
+            X509v3 Subject Alternative Name:
+                DNS:example.com, DNS:www.example.com
+"""
+
+
+class TestCertificateCheck(unittest.TestCase):
+
+    def test_valid(self):
+        check = CertificateCheck(
+            CERTIFICATE_TEXT, ['www.example.com', 'Example.com'])
+        self.assertEqual(check.get_domains(), ['example.com', 'www.example.com'])
+        self.assertEqual(check.get_key_type(), 'ecdsa')
+        self.assertEqual(check.get_decision(), {
+            'run_certbot'  : False,
+            'force_renewal': False,
+        })
+
+
+    def test_renewal(self):
+        domains = ['example.com', 'www.example.com']
+        for check in [
+            CertificateCheck(CERTIFICATE_TEXT, domains, expiring=True),
+            CertificateCheck(CERTIFICATE_TEXT, domains, key_type='rsa'),
+        ]:
+            self.assertEqual(check.get_decision(), {
+                'run_certbot'  : True,
+                'force_renewal': True,
+            })
+
+
+    def test_changed_domains(self):
+        for text in [CERTIFICATE_TEXT, '']:
+            check = CertificateCheck(text, ['example.com'])
+            self.assertEqual(check.get_decision(), {
+                'run_certbot'  : True,
+                'force_renewal': False,
+            })
+
+
+    def test_main(self):
+        result = subprocess.run([
+            sys.executable, '-m', 'lampsible.certificate_check',
+            '--domains', 'example.com,www.example.com',
+            '--key-type', 'rsa',
+        ], input=CERTIFICATE_TEXT.replace('id-ecPublicKey', 'rsaEncryption'),
+            capture_output=True, text=True, check=True)
+        self.assertFalse(json.loads(result.stdout)['run_certbot'])
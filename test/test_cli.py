@@ -0,0 +1,72 @@
+import os
+import sys
+import subprocess
+import unittest
+from unittest import mock
+from tempfile import TemporaryDirectory
+
+
+class TestCli(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        # --help, --version and invalid arguments should not have to wait
+        # for Ansible and friends to be imported.
+        result = subprocess.run([
+            sys.executable,
+            '-c',
+            'import sys, lampsible.cli; print(",".join(sys.modules))'
+        ], capture_output=True, text=True, check=True)
+        modules = result.stdout.strip().split(',')
+        for module in ['ansible', 'ansible_runner', 'requests', 'yaml', 'fqdn']:
+            self.assertNotIn(module, modules)
+
+
+    def test_version(self):
+        result = subprocess.run(
+            [sys.executable, '-m', 'lampsible.cli', '--version'],
+            capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0)
+        from lampsible import __version__
+        self.assertEqual(result.stdout.strip(), __version__)
+
+
+    def test_plan_without_cached_facts(self):
+        # Gathering the facts is a run of its own, which cleans up the
+        # private data dir, so the plan action must not do it again.
+        from ansible_runner import Runner
+        from lampsible import cli
+        with TemporaryDirectory() as tmp_dir:
+            private_data_dir = os.path.join(tmp_dir, 'private-data')
+            with mock.patch.object(Runner, 'run'), \
+                    mock.patch.object(Runner, 'stats', new={}), \
+                    mock.patch('lampsible.helpers.ensure_ansible_galaxy_dependencies',
+                        return_value=0):
+                result = cli.main([
+                    'user@localhost',
+                    'plan',
+                    '--fact-cache-dir', os.path.join(tmp_dir, 'facts'),
+                    '--private-data-dir', private_data_dir,
+                ])
+            # We got no facts, so there's nothing to plan.
+            self.assertEqual(result, 1)
+            self.assertFalse(os.path.isdir(private_data_dir))
+
+
+    def test_object_cache_fleet(self):
+        # Each web server would get its own cache, so this is refused.
+        from lampsible import cli
+        with TemporaryDirectory() as tmp_dir:
+            result = cli.main([
+                'user@one.example.com,user@two.example.com',
+                'lamp-stack',
+                '--object-cache', 'redis',
+                '--database-username', 'db-user',
+                '--database-name', 'db',
+                '--database-password', 'password',
+                '--email-for-ssl', 'me@example.com',
+                '--insecure-cli-password',
+                '--fact-cache-dir', tmp_dir,
+                '--private-data-dir', os.path.join(tmp_dir, 'private-data'),
+            ])
+        self.assertEqual(result, 1)
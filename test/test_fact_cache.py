@@ -0,0 +1,62 @@
+import os
+import json
+import unittest
+from tempfile import TemporaryDirectory
+from lampsible.fact_cache import FactCache
+
+
+class TestFactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.fact_cache = FactCache(self.tmp_dir.name, 60)
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def _write(self, filename, data):
+        with open(os.path.join(self.tmp_dir.name, filename), 'w') as f:
+            f.write(json.dumps(data))
+
+
+    def test_legacy_format(self):
+        self._write('somehost.com', {'ansible_distribution_major_version': '22'})
+        self.assertEqual(
+            self.fact_cache.get_facts('somehost.com'),
+            {'ansible_distribution_major_version': '22'}
+        )
+
+
+    def test_payload_format(self):
+        self._write('s1_somehost.com', {'__payload__': json.dumps({
+            'ansible_distribution_major_version': '24',
+            'ubuntu_version': {
+                'value': '24',
+                '__ansible_type': '_AnsibleTaggedStr',
+            },
+        })})
+        facts = self.fact_cache.get_facts('somehost.com')
+        self.assertEqual(facts['ubuntu_version'], '24')
+        self.assertEqual(self.fact_cache.get_facts('otherhost.com'), {})
+
+
+    def test_expired(self):
+        self._write('somehost.com', {'ansible_distribution_major_version': '22'})
+        tmp_path = os.path.join(self.tmp_dir.name, 'somehost.com')
+        os.utime(tmp_path, (0, 0))
+        self.assertEqual(self.fact_cache.get_facts('somehost.com'), {})
+        self.fact_cache.ttl = 0
+        self.assertNotEqual(self.fact_cache.get_facts('somehost.com'), {})
+
+
+    def test_invalidate(self):
+        self._write('somehost.com', {'foo': 'bar'})
+        self._write('s1_somehost.com', {'__payload__': '{"foo": "bar"}'})
+        self._write('otherhost.com', {'foo': 'bar'})
+        self.fact_cache.invalidate('somehost.com')
+        self.assertEqual(self.fact_cache.get_facts('somehost.com'), {})
+        self.assertNotEqual(self.fact_cache.get_facts('otherhost.com'), {})
+        self.fact_cache.invalidate()
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
@@ -0,0 +1,29 @@
+import os
+import runpy
+import unittest
+from lampsible.constants import PROJECT_DIR
+from lampsible.capacity_planner import CapacityPlanner
+
+
+class TestFilterPlugins(unittest.TestCase):
+
+    def setUp(self):
+        self.filters = runpy.run_path(os.path.join(
+            PROJECT_DIR,
+            'filter_plugins',
+            'lampsible_filters.py'
+        ))['FilterModule']().filters()
+
+
+    def test_capacity_plan(self):
+        self.assertEqual(
+            self.filters['capacity_plan'](2048, 2, web=True, database=False),
+            CapacityPlanner(2048, 2, database=False).get_plan()
+        )
+
+
+    def test_certbot_decision(self):
+        self.assertEqual(
+            self.filters['certbot_decision']('', ['example.com'], 'ecdsa'),
+            {'run_certbot': True, 'force_renewal': False}
+        )
@@ -0,0 +1,84 @@
+import os
+import json
+import unittest
+from hashlib import sha256
+from tempfile import TemporaryDirectory
+from lampsible.helpers import (
+    get_installed_collections, collection_version_matches,
+    ensure_ansible_galaxy_dependencies, find_offline_collection_tarballs,
+    read_galaxy_stamp
+)
+
+
+class TestHelpers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.home_dir = self.tmp_dir.name
+        self.requirements_file = os.path.join(self.home_dir, 'requirements.yml')
+        self.stamp_file = os.path.join(self.home_dir, 'galaxy.stamp')
+        with open(self.requirements_file, 'w') as f:
+            f.write('collections:\n  - name: community.mysql\n    version: ">=3.0.0"\n')
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def _install(self, namespace, name, version):
+        collection_dir = os.path.join(self.home_dir, '.ansible', 'collections',
+            'ansible_collections', namespace, name)
+        os.makedirs(collection_dir)
+        with open(os.path.join(collection_dir, 'MANIFEST.json'), 'w') as f:
+            json.dump({'collection_info': {
+                'namespace': namespace,
+                'name': name,
+                'version': version,
+            }}, f)
+
+
+    def test_installed_collections(self):
+        self._install('community', 'mysql', '3.12.0')
+        installed = get_installed_collections(
+            [os.path.join(self.home_dir, '.ansible', 'collections')])
+        self.assertEqual(installed['community.mysql']['version'], '3.12.0')
+
+
+    def test_version_matches(self):
+        self.assertTrue(collection_version_matches('3.12.0', None))
+        self.assertTrue(collection_version_matches('3.12.0', '>=3.0.0,<4.0.0'))
+        self.assertFalse(collection_version_matches('2.3.0', '>=3.0.0'))
+        self.assertTrue(collection_version_matches('10.2.0', '10.2.0'))
+
+
+    def test_stamp(self):
+        self._install('community', 'mysql', '3.12.0')
+        self.assertEqual(ensure_ansible_galaxy_dependencies(
+            self.requirements_file, self.home_dir, self.stamp_file), 0)
+        with open(self.stamp_file, 'r') as f:
+            stamp = json.load(f)
+        self.assertIn('community.mysql', stamp['collections'])
+        self.assertTrue(read_galaxy_stamp(
+            self.stamp_file, stamp['requirements_hash']))
+        # The stamp must be ignored when the requirements change.
+        self.assertFalse(read_galaxy_stamp(
+            self.stamp_file, sha256(b'other').hexdigest()))
+        # ... or when the collection is gone.
+        os.remove(stamp['collections']['community.mysql']['manifest'])
+        self.assertFalse(read_galaxy_stamp(
+            self.stamp_file, stamp['requirements_hash']))
+
+
+    def test_offline_tarballs(self):
+        for filename in [
+            'community-mysql-3.9.0.tar.gz',
+            'community-mysql-3.12.0.tar.gz',
+        ]:
+            open(os.path.join(self.home_dir, filename), 'w').close()
+        tarballs, missing = find_offline_collection_tarballs(
+            ['community.mysql', 'community.crypto'], self.home_dir)
+        self.assertEqual(
+            [os.path.basename(path) for path in tarballs],
+            ['community-mysql-3.12.0.tar.gz']
+        )
+        self.assertEqual(missing, ['community.crypto'])
@@ -1,7 +1,16 @@
 import os
+import json
+import shutil
+import asyncio
+import tarfile
 import unittest
+import subprocess
+from unittest import mock
+from textwrap import dedent
+from tempfile import TemporaryDirectory
 from lampsible import __version__
 from lampsible.lampsible import Lampsible
+from lampsible.artifact_cache import ArtifactCache
 from lampsible.constants import *
 
 class TestLampsible(unittest.TestCase):
@@ -134,6 +143,296 @@ class TestLampsible(unittest.TestCase):
         self._do_test_run()
 
 
+    def test_apt_packages(self):
+        self.lampsible.php_version = '8.3'
+        self.lampsible.php_extensions = ['php8.3-mysql', 'php8.3-xml']
+        self.lampsible.set_action('drupal')
+        self.assertEqual(self.lampsible.get_apt_packages(), [
+            'php8.3',
+            'php8.3-mysql',
+            'php8.3-xml',
+            'php8.3-gd',
+            'php8.3-curl',
+            'php8.3-mbstring',
+        ])
+        self.lampsible.php_fpm = True
+        self.assertEqual(self.lampsible.get_apt_packages()[:3], [
+            'php8.3-fpm',
+            'php8.3-cli',
+            'php8.3-mysql',
+        ])
+        self.lampsible.set_action('apache')
+        self.assertEqual(self.lampsible.get_apt_packages(), [])
+
+
+    def test_opcache_profile(self):
+        self.lampsible.set_action('laravel')
+        self.lampsible.app_name = 'some-app'
+        self.assertFalse(self.lampsible.opcache_validates_timestamps())
+        self.assertEqual(
+            self.lampsible.get_php_preload()['root'],
+            '{}/some-app'.format(DEFAULT_APACHE_DOCUMENT_ROOT)
+        )
+        self.lampsible.app_local_env = True
+        self.assertTrue(self.lampsible.opcache_validates_timestamps())
+        self.assertIsNone(self.lampsible.get_php_preload())
+        self.lampsible.app_local_env = False
+        self.lampsible.set_action('wordpress')
+        self.assertTrue(self.lampsible.opcache_validates_timestamps())
+        self.assertIsNone(self.lampsible.get_php_preload())
+        self.assertIn('7.4', PHP_PRELOAD_VERSIONS)
+        self.assertNotIn('7.4', PHP_JIT_VERSIONS)
+
+
+    def test_object_cache(self):
+        self.lampsible.php_version = '8.3'
+        self.lampsible.object_cache = 'redis'
+        self.lampsible.set_action('drupal')
+        self.assertIn('php8.3-redis', self.lampsible.get_apt_packages())
+        self.assertIn('drupal/redis', self.lampsible.composer_packages)
+        # Nothing must leak into the defaults of other instances.
+        other = Lampsible(
+            web_user='user',
+            web_host='localhost',
+            action='apache',
+            private_data_dir=os.path.join('test', 'tmp-private-data'),
+        )
+        self.assertEqual(other.composer_packages, [])
+        self.assertEqual(other.php_extensions, [])
+
+
+    def test_object_cache_dropin(self):
+        from jinja2 import Environment, FileSystemLoader
+        env = Environment(loader=FileSystemLoader(os.path.join(
+            PROJECT_DIR, 'roles', 'wordpress', 'templates')))
+        env.filters['to_json'] = json.dumps
+        # Without the PHP extension, or without a server to talk to,
+        # the drop-in must still work, like WordPress' own cache.
+        harness = dedent("""
+            function is_multisite() { return false; }
+            function wp_suspend_cache_addition() { return false; }
+            require $argv[1];
+            wp_cache_init();
+            wp_cache_set('foo', false, 'bar');
+            wp_cache_add_multiple(array('a' => 1, 'b' => 2), 'bar');
+            echo json_encode(array(
+                wp_cache_get('foo', 'bar', false, $found), $found,
+                wp_cache_get_multiple(array('a', 'b', 'c'), 'bar'),
+                wp_cache_supports('flush_group'),
+            ));
+        """)
+        for object_cache in SUPPORTED_OBJECT_CACHES:
+            dropin = env.get_template('object-cache.php.j2').render(
+                object_cache=object_cache,
+                database_name='wordpress',
+                database_table_prefix='wp_',
+            )
+            self.assertNotIn('\\Exception', dropin)
+            for function in [
+                'wp_cache_get_multiple',
+                'wp_cache_set_multiple',
+                'wp_cache_add_multiple',
+                'wp_cache_delete_multiple',
+            ]:
+                self.assertIn('function {}('.format(function), dropin)
+            if not shutil.which('php'):
+                continue
+            with TemporaryDirectory() as tmp_dir:
+                dropin_path = os.path.join(tmp_dir, 'object-cache.php')
+                with open(dropin_path, 'w') as f:
+                    f.write(dropin)
+                result = subprocess.run(
+                    ['php', '-r', harness, dropin_path],
+                    capture_output=True, text=True, check=True
+                )
+            self.assertEqual(
+                json.loads(result.stdout),
+                [False, True, {'a': 1, 'b': 2, 'c': False}, False]
+            )
+
+
+    def test_http_performance(self):
+        self.lampsible.set_action('wordpress')
+        self.lampsible._set_apache_vars()
+        self.assertFalse(self.lampsible.apache_vhosts[0]['http2'])
+        self.lampsible.http_performance = True
+        self.lampsible.ssl_certbot = False
+        self.lampsible.ssl_selfsigned = True
+        self.lampsible._set_apache_vars()
+        self.assertEqual(len(self.lampsible.apache_vhosts), 2)
+        for vhost in self.lampsible.apache_vhosts:
+            for key in ['http2', 'compression', 'static_caching', 'sendfile']:
+                self.assertTrue(vhost[key])
+
+
+    def test_offline_artifacts(self):
+        with TemporaryDirectory() as tmp_dir:
+            self.lampsible.artifact_cache = ArtifactCache(tmp_dir, 1024, True)
+            for key in [
+                'wp-cli/{}'.format(DEFAULT_WP_CLI_VERSION),
+                'wordpress/6.7.1/en_US',
+                'wordpress/6.10/en_US',
+                'wordpress/6.11/de_DE',
+            ]:
+                tmp_path = os.path.join(tmp_dir, 'tmp')
+                with open(tmp_path, 'w') as f:
+                    f.write(key)
+                self.lampsible.artifact_cache.put(key, tmp_path)
+            self.lampsible.set_action('wordpress')
+            self.lampsible._prepare_artifacts()
+            self.assertEqual(self.lampsible.wordpress_resolved_version, '6.10')
+            self.assertIsNotNone(self.lampsible.wp_cli_local_path)
+
+            self.lampsible.wordpress_version = '6.9'
+            with self.assertRaises(RuntimeError):
+                self.lampsible._prepare_artifacts()
+
+            self.lampsible.set_action('joomla')
+            self.lampsible.joomla_version = '5.2.3'
+            self.assertEqual(
+                self.lampsible.get_joomla_package_url(),
+                'https://downloads.joomla.org/cms/joomla5/5-2-3/Joomla_5-2-3-Stable-Full_Package.tar.gz'
+            )
+            with self.assertRaises(RuntimeError):
+                self.lampsible._prepare_artifacts()
+
+
+    def test_composer_cache(self):
+        with TemporaryDirectory() as tmp_dir:
+            os.makedirs(os.path.join(tmp_dir, 'files', 'drush', 'drush'))
+            with open(os.path.join(
+                tmp_dir, 'files', 'drush', 'drush', 'abcd.zip'
+            ), 'w') as f:
+                f.write('zip')
+            self.lampsible.composer_cache_dir = tmp_dir
+            self.lampsible.set_action('drupal')
+            self.lampsible._prepare_artifacts()
+            with tarfile.open(self.lampsible.composer_cache_archive) as archive:
+                self.assertIn(
+                    'files/drush/drush/abcd.zip',
+                    archive.getnames()
+                )
+
+
+    def test_role_fingerprints(self):
+        self.lampsible.set_action('wordpress')
+        role_groups = self.lampsible.get_playbook_roles()
+        self.assertEqual(role_groups['database_servers'], ['pip', 'mysql'])
+        self.assertIn('fail2ban', role_groups['web_servers'])
+        self.assertIn('ssl-certbot', role_groups['web_servers'])
+
+        variables = {'site_title': 'Some Site', 'php_version': '8.3'}
+        fingerprints = self.lampsible.get_role_fingerprints(
+            variables, role_groups)
+        variables['site_title'] = 'Other Site'
+        changed = self.lampsible.get_role_fingerprints(variables, role_groups)
+        self.assertEqual(
+            [role for role in fingerprints if fingerprints[role] != changed[role]],
+            ['wordpress']
+        )
+        self.assertNotIn('ssl-certbot', fingerprints)
+
+        self.lampsible.converge = False
+        self.assertEqual(
+            self.lampsible.get_role_fingerprints(variables, role_groups), {})
+
+
+    def test_fleet_host_vars(self):
+        fleet = Lampsible(
+            web_user='user',
+            web_host=None,
+            web_hosts=['user@one.example.com', 'two.example.com'],
+            action='wordpress',
+            private_data_dir=os.path.join(
+                'test',
+                'tmp-private-data',
+            ),
+        )
+        self.assertTrue(fleet.is_fleet())
+        self.assertEqual(fleet.web_hosts[1], ('user', 'two.example.com'))
+        fleet._set_apache_vars()
+        host_vars = fleet._get_host_vars('two.example.com')
+        self.assertEqual(
+            host_vars['apache_vhosts'][0]['server_name'],
+            'two.example.com'
+        )
+        self.assertEqual(
+            host_vars['certbot_domains_string'],
+            '-d two.example.com -d www.two.example.com'
+        )
+        self.assertEqual(
+            host_vars['certbot_domains'],
+            ['two.example.com', 'www.two.example.com']
+        )
+        fleet.private_data_helper.cleanup_dir()
+
+
+    def test_capacity_planners_without_facts(self):
+        from ansible_runner import Runner
+        self.lampsible.set_action('wordpress')
+        with mock.patch.object(Runner, 'run') as run, \
+                mock.patch.object(Runner, 'stats', new={}), \
+                mock.patch.object(
+                    self.lampsible.fact_cache, 'get_facts', return_value={}):
+            self.assertEqual(self.lampsible.get_capacity_planners(), {})
+        run.assert_called_once()
+        # Gathering the facts must leave us able to run our own action.
+        self.assertEqual(self.lampsible.action, 'wordpress')
+        self.assertTrue(os.path.isdir(
+            self.lampsible.private_data_helper.get_dir_path()))
+        self.lampsible.private_data_helper.cleanup_dir()
+
+
+    def test_transport_envvars(self):
+        self.assertNotIn('ANSIBLE_CONFIG', self.lampsible.runner_config.envvars)
+        with mock.patch.dict(os.environ, {'ANSIBLE_TIMEOUT': '60'}):
+            envvars = self.lampsible._get_transport_envvars()
+        self.assertEqual(envvars['ANSIBLE_PIPELINING'], 'True')
+        self.assertNotIn('ANSIBLE_TIMEOUT', envvars)
+
+
+    def test_run_async(self):
+        self.lampsible.set_action('apache')
+
+        async def do_run():
+            run = self.lampsible.run_async()
+            events = [event['event'] async for event in run.events()]
+            return await run, events
+
+        result, events = asyncio.run(do_run())
+        self.assertEqual(result, 0)
+        self.assertIn('playbook_on_stats', events)
+
+
+    def test_run_async_error(self):
+        with TemporaryDirectory() as tmp_dir:
+            self.lampsible.artifact_cache = ArtifactCache(tmp_dir, 1024, True)
+            self.lampsible.set_action('wordpress')
+            self.assertEqual(self.lampsible.run(), 1)
+
+            async def do_run():
+                return await self.lampsible.run_async()
+
+            self.assertEqual(asyncio.run(do_run()), 1)
+
+
+    def test_run_async_cancel(self):
+        self.lampsible.set_action('apache')
+
+        async def do_run():
+            run = self.lampsible.run_async()
+            self.lampsible.runner_config.command = ['sleep', '60']
+            await asyncio.sleep(0.5)
+            run.task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await run
+            return run
+
+        run = asyncio.run(do_run())
+        self.assertIsNotNone(run.process.returncode)
+        self.lampsible.private_data_helper.cleanup_dir()
+
+
     def _do_test_run(self):
         result = self.lampsible.run()
         self.assertEqual(result, 0)
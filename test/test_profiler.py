@@ -0,0 +1,72 @@
+import unittest
+from lampsible.profiler import Profiler
+
+
+def make_event(host, task, role, start, end, task_uuid, event='runner_on_ok',
+        task_action='command', res={}):
+    return {
+        'event': event,
+        'event_data': {
+            'play': 'web_servers',
+            'role': role,
+            'task': task,
+            'host': host,
+            'task_uuid': task_uuid,
+            'start': '2025-01-01T00:00:{:02d}+00:00'.format(start),
+            'end': '2025-01-01T00:00:{:02d}+00:00'.format(end),
+            'task_action': task_action,
+            'res': res,
+        },
+    }
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = Profiler([
+            {'event': 'playbook_on_start', 'event_data': {}},
+            make_event('one', 'Install packages', 'apt', 0, 10, 'a'),
+            make_event('two', 'Install packages', 'apt', 0, 12, 'a'),
+            make_event('one', 'Download WordPress', 'wordpress', 12, 15, 'b'),
+            make_event('one', 'Install Certbot', 'ssl-certbot', 15, 16, 'c',
+                'runner_on_failed'),
+        ])
+
+
+    def test_report(self):
+        report = self.profiler.get_report()
+        self.assertEqual(report['total_wall_time'], 16)
+        self.assertEqual(report['tasks'][0]['task'], 'Install packages')
+        self.assertEqual(report['tasks'][0]['wall_time'], 12)
+        self.assertEqual(report['tasks'][0]['hosts'], {'one': 10, 'two': 12})
+        self.assertEqual(
+            [role['role'] for role in report['roles']],
+            ['apt', 'wordpress', 'ssl-certbot']
+        )
+
+
+    def test_async_jobs(self):
+        job = {'ansible_job_id': 'j1', 'started': 1, 'finished': 0}
+        done = {'ansible_job_id': 'j1', 'started': 1, 'finished': 1}
+        profiler = Profiler([
+            make_event('one', 'Start installing Certbot', 'ssl-certbot',
+                0, 1, 'a', res=job),
+            make_event('one', 'Install packages', 'apt', 1, 20, 'b'),
+            make_event('one', 'Wait for Certbot', 'ssl-certbot', 20, 25, 'c',
+                task_action='async_status', res=done),
+        ])
+        report = profiler.get_report()
+        self.assertEqual(report['total_overlap'], 19)
+        self.assertEqual(report['async_jobs'][0]['task'],
+            'Start installing Certbot')
+        self.assertEqual(report['async_jobs'][0]['joined_by'],
+            'Wait for Certbot')
+        self.assertEqual(report['async_jobs'][0]['waited'], 5)
+        self.assertEqual(self.profiler.get_report()['async_jobs'], [])
+
+
+    def test_folded_stacks(self):
+        self.assertIn(
+            'web_servers;apt;Install packages;two 12000',
+            self.profiler.get_folded_stacks()
+        )